@@ -46,11 +46,20 @@
 3. 选择文件
    • 点击"选择待审 Excel"加载翻译文件
    • (可选) 点击"选择术语表"加载术语对照表
+   • (可选) 点击"选择 TM"加载翻译记忆，精确匹配的行不送审
 
 4. 开始审计
    • 点击"🚀 开始自动化审计"
    • 等待处理完成，查看结果
 
+5. 命令行批量模式 (不启动界面)
+   python lqa_tool.py 文件或目录... --api-key AIza... --workers 8 --out reports/
+   • 多个文件共享同一并发上限，输出每个文件的报告和 LQA_Summary.json
+   • --targets EN DE FR (或 auto) 一次审计多个译文列，表格只读一遍
+   • --backend openai/mock 可切换到 OpenAI 兼容接口或本地模拟服务器
+   • python lqa_tool.py --bench 离线测量吞吐、批次延迟与峰值内存
+   • 全部参数见 python lqa_tool.py --help
+
 ==============================================================================
 📊 输入格式要求
 ==============================================================================
@@ -60,6 +69,9 @@ Excel 文件应包含以下列：
 • 译文 (Translation)  
 • 上下文 (Context) - 可选
 
+支持 .xlsx / .xls / .csv / .parquet (parquet 需 pip install pyarrow)，
+大表按块流式读取，边读边审。
+
 ==============================================================================
 ⚠️ 免责声明
 ==============================================================================
@@ -70,130 +82,3148 @@ Excel 文件应包含以下列：
 ==============================================================================
 """
 
-import tkinter as tk
-from tkinter import filedialog, messagebox
-import customtkinter as ctk  # 更好的 UI 库
 import pandas as pd
-import google.generativeai as genai
+import numpy as np
 import threading
 import os
+import sys
+import argparse
+import time
+import json
+import hashlib
+import sqlite3
+import re
+import csv
+import random
+import itertools
+import tempfile
+import datetime
+import urllib.request
+import urllib.error
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-# 设置 UI 风格
-ctk.set_appearance_mode("System")
-ctk.set_default_color_theme("blue")
+try:
+    import resource  # 仅用于基准测试统计峰值内存 (Windows 下不可用)
+except ImportError:
+    resource = None
 
-class LQAToolApp(ctk.CTk):
-    def __init__(self):
-        super().__init__()
-
-        self.title("Game Localization LQA Master - AI 自动化审计工具")
-        self.geometry("800x600")
-
-        # --- UI 布局 ---
-        self.grid_columnconfigure(1, weight=1)
-
-        # 1. API 配置
-        self.api_label = ctk.CTkLabel(self, text="Gemini API Key:")
-        self.api_label.grid(row=0, column=0, padx=20, pady=10, sticky="w")
-        self.api_entry = ctk.CTkEntry(self, placeholder_text="在此输入你的 API Key...", width=400)
-        self.api_entry.grid(row=0, column=1, padx=20, pady=10, sticky="ew")
-
-        # 2. 文件选择
-        self.file_btn = ctk.CTkButton(self, text="选择待审 Excel", command=self.select_file)
-        self.file_btn.grid(row=1, column=0, padx=20, pady=10)
-        self.file_label = ctk.CTkLabel(self, text="未选择文件", text_color="gray")
-        self.file_label.grid(row=1, column=1, padx=20, pady=10, sticky="w")
-
-        self.glossary_btn = ctk.CTkButton(self, text="选择术语表 (可选)", command=self.select_glossary)
-        self.glossary_btn.grid(row=2, column=0, padx=20, pady=10)
-        self.glossary_label = ctk.CTkLabel(self, text="未选择术语表", text_color="gray")
-        self.glossary_label.grid(row=2, column=1, padx=20, pady=10, sticky="w")
-
-        # 3. 运行控制
-        self.run_btn = ctk.CTkButton(self, text="🚀 开始自动化审计", command=self.start_audit_thread, fg_color="#2ECC71", hover_color="#27AE60")
-        self.run_btn.grid(row=3, column=0, columnspan=2, padx=20, pady=20, sticky="ew")
-
-        # 4. 日志输出
-        self.log_output = ctk.CTkTextbox(self, height=300)
-        self.log_output.grid(row=4, column=0, columnspan=2, padx=20, pady=10, sticky="nsew")
-
-        # 5. 进度条
-        self.progress_bar = ctk.CTkProgressBar(self)
-        self.progress_bar.grid(row=5, column=0, columnspan=2, padx=20, pady=10, sticky="ew")
-        self.progress_bar.set(0)
-
-        # 内部变量
-        self.input_path = ""
-        self.glossary_path = ""
-
-    def select_file(self):
-        self.input_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx *.xls")])
-        if self.input_path:
-            self.file_label.configure(text=os.path.basename(self.input_path), text_color="white")
-
-    def select_glossary(self):
-        self.glossary_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx *.xls")])
-        if self.glossary_path:
-            self.glossary_label.configure(text=os.path.basename(self.glossary_path), text_color="white")
-
-    def log(self, message):
-        self.log_output.insert("end", f"{message}\n")
-        self.log_output.see("end")
-
-    def start_audit_thread(self):
-        # 验证输入
-        if not self.api_entry.get():
-            messagebox.showerror("错误", "请输入 API Key")
-            return
-        if not self.input_path:
-            messagebox.showerror("错误", "请选择待审计的 Excel 文件")
+MODEL_NAME = "gemini-1.5-flash"
+DEFAULT_WORKERS = 4      # 同时在途的请求数 (受 API 配额限制，不宜过大)
+
+# 限流调度：按账号配额填写。遇到 429 / 配额错误时指数退避重试，并自动降低并发
+RPM_LIMIT = 120          # 每分钟请求数，0 表示不限
+TPM_LIMIT = 1000000      # 每分钟 token 数 (按估算值计)，0 表示不限
+RESPONSE_TOKEN_ALLOWANCE = 300  # 计入 TPM 的预估输出 token
+MAX_RETRIES = 6
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 60.0
+
+# 对冲请求 (--hedge)：请求耗时超过近期 P95 仍未返回时再发一份，取先返回者
+HEDGE_PERCENTILE = 95
+HEDGE_BUDGET = 0.05      # 额外请求数占请求总数的上限
+HEDGE_MIN_SAMPLES = 20   # 延迟样本不足时不对冲
+HEDGE_WINDOW = 200       # 计算百分位的最近样本数
+
+# 模型后端：gemini / openai (OpenAI 兼容接口) / mock (本地模拟服务器) / fake (进程内假模型)
+BACKENDS = ["gemini", "openai", "mock", "fake"]
+HTTP_TIMEOUT_S = 120
+BENCH_SIZES = [1000, 10000, 100000]
+BENCH_FILE = "LQA_Benchmark.json"
+
+# 本地响应缓存：内容不变的批次直接复用上次的审计结果
+CACHE_DB_FILE = "lqa_cache.sqlite3"
+CACHE_MAX_AGE_DAYS = 30
+CACHE_MAX_MB = 200
+
+# 增量审计：项目索引记录上一版每行 (ID → 原文+译文+上下文 哈希) 及其 AI 问题，未变化的行直接沿用
+PROJECT_INDEX_SUFFIX = "_lqa_project.sqlite3"  # GUI 勾选“增量审计”时为待审文件同目录下的 <文件名>_lqa_project.sqlite3，
+# 按工作簿各用一个索引：同目录下的不同表格互不覆盖
+
+# 自适应分批：按估算 token 数 (原文 + 译文 + 注入术语) 装箱，而不是固定 10 行一批。
+# 预算决定单个请求的耗时，调小可降低单批延迟，调大可减少请求数。
+TOKEN_BUDGET = 1500
+MIN_BATCH_ROWS = 5
+MAX_BATCH_ROWS = 60
+
+READ_CHUNK_ROWS = 5000   # 流式读取时每块的行数
+INPUT_FILETYPES = [("LQA 表格", "*.xlsx *.xlsm *.xls *.csv *.parquet"), ("Excel files", "*.xlsx *.xls")]
+
+# 本地预检：机械性问题在本地一次扫完，不再占用模型请求
+MAX_TEXT_LEN = 30        # 未提供字体 / 框宽时的“爆框”阈值 (字符数)
+FONT_SIZE = 24           # 像素宽度检查的默认字号 (px)，布局表可按 ID 覆盖
+TARGET_LANGUAGES = ["English", "German", "French", "Turkish", "Spanish", "Portuguese", "Russian", "Japanese", "Korean"]
+# 多语言扇出时按列名推断语言
+LANGUAGE_CODES = {"EN": "English", "DE": "German", "FR": "French", "TR": "Turkish", "ES": "Spanish", "PT": "Portuguese",
+                  "RU": "Russian", "JA": "Japanese", "JP": "Japanese", "KO": "Korean", "KR": "Korean", "ZH": "Chinese"}
+HAN_TARGET_LANGUAGES = {"Japanese", "Chinese"}  # 译文中允许出现汉字的语言
+
+# 术语一致性本地检查 (见 GlossaryEnforcer)：术语表译法的常见词形变化，匹配时忽略大小写
+GLOSSARY_SUFFIXES = {"English": ["s", "es", "'s"], "German": ["e", "en", "n", "s", "es", "er", "ern", "em"],
+                     "French": ["s", "x"], "Spanish": ["s", "es"], "Portuguese": ["s", "es"]}
+# 词形变化多的语言按词干前缀匹配：词尾字母按表去掉 / 替换后允许后接任意字母
+GLOSSARY_STEM_ENDINGS = {"Russian": {c: "" for c in "аяоеыийь"},
+                         "Turkish": {"p": "b", "ç": "c", "t": "d", "k": "ğ"},  # 辅音软化：kitap → kitabı
+                         "Korean": {}}                                          # 助词直接粘在名词后
+GLOSSARY_SPLIT_RE = re.compile(r"\s*[;；/]\s*")  # 一个单元格中的多个可用 / 禁用译法
+
+# 输出文件 (与待审文件同目录，命令行可用 --out 指定目录)：
+#   <文件名>_LQA_Report.txt  模型原始输出     <文件名>_LQA_PreCheck.csv  预检明细
+#   <文件名>_LQA.xlsx        问题回填到原表   <文件名>_LQA_Issues.csv / .parquet  问题清单
+REPORT_SUFFIX = "_LQA_Report.txt"
+PRECHECK_SUFFIX = "_LQA_PreCheck.csv"
+MERGED_SUFFIX = "_LQA.xlsx"
+ISSUES_SUFFIX = "_LQA_Issues"
+SUMMARY_FILE = "LQA_Summary.json"  # 命令行批量模式的汇总
+
+ISSUE_COLUMNS = ["LQA 来源", "LQA 类别", "LQA 问题", "LQA 建议"]
+ISSUE_FILL_COLOR = "FFF2CC"
+CLUSTER_COLUMN = "LQA 簇"
+
+# 遥测：每批一行 JSONL 追踪 + Prometheus 文本格式快照
+TRACE_SUFFIX = "_LQA_Trace.jsonl"
+METRICS_SUFFIX = "_LQA_Metrics.prom"
+METRICS_FLUSH_S = 5      # 快照刷新间隔 (秒)
+ETA_LOG_EVERY = 20       # 多语言扇出时每完成多少批输出一次剩余时间
+LATENCY_BUCKETS = [0.1, 0.5, 1, 2, 4, 8, 16, 32, 64]
+PRICE_INPUT_PER_M = 0.075   # 美元 / 百万输入 token (gemini-1.5-flash 公开价格，仅用于估算)
+PRICE_OUTPUT_PER_M = 0.30   # 美元 / 百万输出 token
+PRICE_CACHED_PER_M = 0.01875  # 美元 / 百万命中上下文缓存的输入 token
+
+# 重复 / 相似文本聚类 (见 TextClusterer)
+CLUSTER_MODE = "exact"   # off / exact / template / near
+NEAR_DUP_THRESHOLD = 0.85  # near 模式下 3-gram Jaccard 相似度阈值
+MINHASH_PERMS = 32
+LSH_BANDS = 8
+
+# 局部性重排 (--group-by prefix / context / 列名)：分批前把同一界面、同一 ID 前缀的行排到一起
+PACK_WINDOW_ROWS = 5000  # 每攒够这么多待送审行重排一次；越大分组越完整，但首批请求要等窗口攒满才发出
+_ID_PREFIX_RE = re.compile(r"^(.+)[._\-/:]")  # 最后一个分隔符之前的部分：UI_Shop_Title → UI_Shop
+
+GLOSSARY_MAX_TERMS = 60  # 单批注入的术语条数上限，命中过多时按出现次数和词长截断
+
+AUDIT_PROMPT_TEMPLATE = "你是一个游戏本地化专家。请根据术语表：\n{glossary}\n审核以下翻译：\n{batch_text}\n指出术语错误、误译漏译或语感生硬（长度与爆框已由本地检查，无需关注）。直接输出 ID | 问题 | 建议。"
+# 固定前缀模式 (--prefix-cache)：角色说明 + 完整术语表作为每个请求都相同的前缀，批次行作为变化的后缀
+AUDIT_PREFIX_TEMPLATE = "你是一个游戏本地化专家。请根据术语表：\n{glossary}\n指出术语错误、误译漏译或语感生硬（长度与爆框已由本地检查，无需关注）。每个问题输出一行：ID | 问题 | 建议。"
+AUDIT_SUFFIX_TEMPLATE = "审核以下翻译：\n{batch_text}\n直接输出 ID | 问题 | 建议。"
+PREFIX_CACHE_TTL_S = 3600  # Gemini 上下文缓存的有效期 (秒)，剩余不足四分之一时自动续期
+
+
+def fingerprint(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cell(value):
+    """单元格转文本，空值 (None / NaN) 视为空串。"""
+    if value is None or value != value:
+        return ""
+    return str(value)
+
+
+def read_table(path):
+    """一次性读取小表 (术语表等)，支持 xlsx / xls / csv / parquet。"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+
+def iter_sheet_chunks(path, chunk_rows=READ_CHUNK_ROWS):
+    """惰性按块读取待审表格，每块为 {列名: 值列表}，内存占用与表格总行数无关。
+
+    xlsx 使用 openpyxl 只读模式逐行迭代；csv 使用 pandas 分块读取；parquet 按 record batch 读取。
+    旧版 xls 无法流式解析，退化为整表读取后分块。
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False):
+            yield {str(c): chunk[c].tolist() for c in chunk.columns}
+    elif ext == ".parquet":
+        import pyarrow.parquet as pq
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield record_batch.to_pydict()
+    elif ext == ".xls":
+        df = pd.read_excel(path)
+        for i in range(0, len(df), chunk_rows):
+            chunk = df.iloc[i : i + chunk_rows]
+            yield {str(c): chunk[c].tolist() for c in chunk.columns}
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+            buffer = []
+            for row in rows:
+                buffer.append(row)
+                if len(buffer) >= chunk_rows:
+                    yield _rows_to_columns(columns, buffer)
+                    buffer = []
+            if buffer:
+                yield _rows_to_columns(columns, buffer)
+        finally:
+            wb.close()
+
+
+def _rows_to_columns(columns, rows):
+    width = len(columns)
+    values = [list(col) for col in zip(*[tuple(r[:width]) + (None,) * (width - len(r)) for r in rows])]
+    return dict(zip(columns, values))
+
+
+def count_rows(path):
+    """估算数据行数 (不含表头) 用于进度显示，无法快速得到时返回 None。"""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == ".csv":
+            with open(path, "rb") as f:
+                return max(0, sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")) - 1)
+        if ext == ".parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(path).metadata.num_rows
+        if ext in (".xlsx", ".xlsm"):
+            import openpyxl
+            wb = openpyxl.load_workbook(path, read_only=True)
+            try:
+                max_row = wb.active.max_row
+            finally:
+                wb.close()
+            return max_row - 1 if max_row else None
+    except Exception:
+        pass
+    return None
+
+
+_HAN_RE = re.compile("[\u3400-\u4dbf\u4e00-\u9fff]")
+# 占位符 / 富文本标签：{0} {name} %s %1$d <color=#FFF> </color> 以及字面量 \n
+_PLACEHOLDER_RE = re.compile(r"\{[^{}]*\}|%(?:\d+\$)?[-+ 0#]*\d*(?:\.\d+)?[sdifuxXc@]|<[^<>]+>|\\n")
+# 句末标点归一化：全角 / 半角视为同一类
+_END_PUNCT = {"。": ".", ".": ".", "…": ".", "？": "?", "?": "?", "！": "!", "!": "!", "：": ":", ":": ":", "，": ",", ",": ","}
+
+
+def load_tm_pairs(path):
+    """读取翻译记忆 (TM)，返回 {原文 + \\x00 + 译文} 集合，用于判定精确匹配。"""
+    df = read_table(path)
+    src_col = "Source" if "Source" in df.columns else df.columns[0]
+    tgt_col = "Target" if "Target" in df.columns else df.columns[1]
+    return set((df[src_col].map(_cell) + "\x00" + df[tgt_col].map(_cell)).tolist())
+
+
+_MARKUP_RE = re.compile(r"<[^<>]+>")  # 富文本标签不占宽度
+_LINE_BREAK_RE = re.compile(r"\r?\n|\\n")  # 真实换行与字面量 \n 都按换行处理
+
+
+class GlyphMetrics:
+    """单个字体文件的字形宽度表。
+
+    BMP 字符的 advance 宽度存放在 65536 项的 float32 数组中 (未测量为 NaN，首次遇到时用 Pillow 测量)，
+    BMP 以外的字符 (emoji 等) 记在字典里。计算宽度时按码位直接索引数组，不逐字符调用 Pillow。
+    只累加 advance，不计字距调整 (kerning)，对爆框判断足够。
+    """
+
+    def __init__(self, font_path, size=FONT_SIZE):
+        from PIL import ImageFont
+        self.font = ImageFont.truetype(font_path, size)
+        self.size = size
+        self.table = np.full(0x10000, np.nan, dtype=np.float32)
+        self.astral = {}
+
+    def _measure(self, codepoint):
+        try:
+            return self.font.getlength(chr(codepoint))
+        except (UnicodeError, ValueError):
+            return 0.0
+
+    def advances(self, codepoints):
+        bmp = codepoints < 0x10000
+        idx = codepoints[bmp]
+        for cp in np.unique(idx[np.isnan(self.table[idx])]):
+            self.table[cp] = self._measure(int(cp))
+        out = np.empty(len(codepoints), dtype=np.float32)
+        out[bmp] = self.table[idx]
+        if not bmp.all():
+            out[~bmp] = [self.astral.setdefault(int(cp), self._measure(int(cp))) for cp in codepoints[~bmp]]
+        return out
+
+    def text_widths(self, texts):
+        """返回每个字符串渲染后最宽一行的像素宽度 (np.ndarray)。"""
+        lines, owners = [], []
+        for i, text in enumerate(texts):
+            for line in _LINE_BREAK_RE.split(_MARKUP_RE.sub("", text)):
+                lines.append(line)
+                owners.append(i)
+        lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+        codepoints = np.frombuffer("".join(lines).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        cumulative = np.concatenate(([0.0], np.cumsum(self.advances(codepoints), dtype=np.float64)))
+        ends = np.cumsum(lengths)
+        line_widths = cumulative[ends] - cumulative[ends - lengths]
+        widths = np.zeros(len(texts))
+        np.maximum.at(widths, np.asarray(owners, dtype=np.int64), line_widths)
+        return widths
+
+
+def load_layout(path):
+    """读取布局表：ID 列 + 框宽列 (Width / MaxWidth / BoxWidth，像素)，可选 FontSize 列按 ID 覆盖字号。
+
+    返回 {ID: (框宽, 字号或 NaN)}。
+    """
+    df = read_table(path)
+    width_col = next((c for c in ("Width", "MaxWidth", "BoxWidth") if c in df.columns), None)
+    if "ID" not in df.columns or width_col is None:
+        raise ValueError(f"布局表需要 ID 列和 Width / MaxWidth / BoxWidth 列: {path}")
+    widths = pd.to_numeric(df[width_col], errors="coerce")
+    sizes = pd.to_numeric(df["FontSize"], errors="coerce") if "FontSize" in df.columns else pd.Series(np.nan, index=df.index)
+    return {str(i): (w, s) for i, w, s in zip(df["ID"].map(_cell), widths, sizes) if w == w}
+
+
+class WidthChecker:
+    """按字体度量检查爆框：译文像素宽度 > 该 ID 的框宽 (布局表) 或默认框宽 default_width。"""
+
+    def __init__(self, metrics, layout=None, default_width=0):
+        self.metrics = metrics
+        self.layout = layout or {}
+        self.default_width = default_width
+
+    def measure(self, ids, targets):
+        """返回 (像素宽度, 框宽) 两个数组，框宽未知的行为 NaN (不检查)。"""
+        widths = self.metrics.text_widths(targets.tolist())
+        boxes = ids.map(lambda i: self.layout.get(i, (np.nan, np.nan)))
+        limits = np.array([b[0] for b in boxes], dtype=np.float64)
+        sizes = np.array([b[1] for b in boxes], dtype=np.float64)
+        if self.default_width:
+            limits = np.where(np.isnan(limits), self.default_width, limits)
+        scale = np.where(np.isnan(sizes), 1.0, sizes / self.metrics.size)  # 布局表指定字号时按比例换算
+        return widths * scale, limits
+
+
+def parse_font_args(values):
+    """把 ["UI.ttf", "Japanese=NotoSansJP.otf"] 解析为 {"": "UI.ttf", "Japanese": "NotoSansJP.otf"}。"""
+    fonts = {}
+    for value in values:
+        lang, sep, path = value.partition("=")
+        if sep and lang in TARGET_LANGUAGES + list(LANGUAGE_CODES.values()):
+            fonts[lang] = path
+        else:
+            fonts[""] = value
+    return fonts
+
+
+def make_width_checker(settings, target_lang, layout=None):
+    """按目标语言选字体 (settings.fonts 中语言专用字体优先，否则用 "" 对应的通用字体)，缺字体或框宽时返回 None。"""
+    font_path = settings.fonts.get(target_lang) or settings.fonts.get("")
+    if not font_path or not (layout or settings.max_width):
+        return None
+    return WidthChecker(GlyphMetrics(font_path, settings.font_size), layout, settings.max_width)
+
+
+def source_features(src):
+    """预检中只依赖原文的部分 (占位符、首尾空白、句末字符)，按列计算，可在多个译文列间复用。"""
+    stripped = src.str.strip()
+    return pd.DataFrame({
+        "tags": src.str.findall(_PLACEHOLDER_RE).map(sorted),
+        "lead": src.str.match(r"\s"),
+        "trail": src.str.contains(r"\s$"),
+        "end": stripped.str[-1:],
+        "has_src": stripped != "",
+    }, index=src.index)
+
+
+class PreChecker:
+    """本地确定性预检引擎。
+
+    对每个数据块用 pandas 字符串向量运算一次性跑完全部规则 (爆框、漏翻、占位符/标签不一致、
+    首尾空白与句末标点不一致、空译文)，结果追加写入 PRECHECK_FILE。
+    爆框在提供 width_checker 时按字体像素宽度与框宽判断，否则按 MAX_TEXT_LEN 字符数估算。
+    提供 glossary_enforcer 时逐行检查术语译法 (Consistency，见 GlossaryEnforcer)。
+    同时决定哪些行需要送审：TM 精确匹配和空译文不送；only_suspicious 时只送有预检问题的行。
+    传入 known_hashes (上一版的 {ID: 行哈希}) 时为增量模式：哈希未变的行不送审，
+    本版全部行的 {ID: (行号, 哈希)} 记录在 row_index 中供写回项目索引。
+    findings_path 为 None 时只统计不落盘。
+    """
+
+    def __init__(self, target_lang="English", tm_pairs=None, only_suspicious=False, findings_path=None, known_hashes=None,
+                 width_checker=None, glossary_enforcer=None):
+        self.target_lang = target_lang
+        self.width_checker = width_checker
+        self.glossary_enforcer = glossary_enforcer
+        self.tm_pairs = tm_pairs or set()
+        self.only_suspicious = only_suspicious
+        self.findings_path = findings_path
+        self.known_hashes = known_hashes
+        self.row_index = {}
+        self.duplicate_ids = set()
+        self.counts = {}
+        self.rows = 0
+        self.sent = 0
+        self.skipped = {"tm": 0, "empty": 0, "clean": 0, "unchanged": 0}
+        self.changed = {"new": 0, "modified": 0}
+
+    def check(self, df, src_features=None):
+        """df 含 Row / ID / Source / Target 列 (均为字符串)，返回 (findings DataFrame, 可疑行掩码)。
+
+        src_features 为 source_features() 的结果，多个译文列共用同一原文时只需计算一次。
+        """
+        src, tgt = df["Source"], df["Target"]
+        if src_features is None:
+            src_features = source_features(src)
+        has_tgt = tgt.str.strip() != ""
+        rules = []
+
+        if self.width_checker:
+            widths, limits = self.width_checker.measure(df["ID"], tgt)
+            over = pd.Series(widths > limits, index=df.index)  # 框宽为 NaN 的行比较结果为 False
+            rules.append(("Truncation", over, "译文宽 " + pd.Series(widths, index=df.index).round().astype(int).astype(str)
+                          + "px，超过框宽 " + pd.Series(np.nan_to_num(limits), index=df.index).round().astype(int).astype(str) + "px"))
+        else:
+            lengths = tgt.str.len()
+            rules.append(("Truncation", lengths > MAX_TEXT_LEN, "译文 " + lengths.astype(str) + f" 字符，超过 {MAX_TEXT_LEN}"))
+
+        if self.target_lang not in HAN_TARGET_LANGUAGES:
+            rules.append(("Untranslated", tgt.str.contains(_HAN_RE), "译文中残留中文"))
+
+        src_tags = src_features["tags"]
+        tgt_tags = tgt.str.findall(_PLACEHOLDER_RE).map(sorted)
+        tag_diff = has_tgt & (src_tags != tgt_tags)
+        rules.append(("Placeholder", tag_diff, "原文 " + src_tags.map(" ".join) + " / 译文 " + tgt_tags.map(" ".join)))
+
+        lead = src_features["lead"] != tgt.str.match(r"\s")
+        trail = src_features["trail"] != tgt.str.contains(r"\s$")
+        rules.append(("Whitespace", has_tgt & (lead | trail), "首尾空白与原文不一致"))
+
+        src_end = src_features["end"].map(_END_PUNCT)
+        tgt_end = tgt.str.strip().str[-1:].map(_END_PUNCT)
+        punct = has_tgt & src_end.notna() & (src_end != tgt_end)
+        rules.append(("Punctuation", punct, "句末标点与原文不一致：" + src_features["end"]))
+
+        rules.append(("Missing", ~has_tgt & src_features["has_src"], "译文为空"))
+
+        if self.glossary_enforcer:
+            if "terms" not in src_features:  # 原文术语匹配结果缓存在共享的原文特征中，多个译文列只算一次
+                src_features["terms"] = [self.glossary_enforcer.index.terms(text) for text in src]
+            problems = pd.Series(["；".join(self.glossary_enforcer.check(terms, text))
+                                  for terms, text in zip(src_features["terms"], tgt)], index=df.index, dtype=object)
+            rules.append(("Consistency", problems != "", problems))
+
+        frames = []
+        suspicious = pd.Series(False, index=df.index)
+        for category, mask, detail in rules:
+            mask = mask.fillna(False).astype(bool)
+            if not mask.any():
+                continue
+            suspicious |= mask
+            self.counts[category] = self.counts.get(category, 0) + int(mask.sum())
+            detail = detail[mask] if isinstance(detail, pd.Series) else detail
+            frames.append(pd.DataFrame({"Row": df["Row"][mask], "ID": df["ID"][mask], "Category": category, "Detail": detail}))
+        findings = pd.concat(frames).sort_values("Row", kind="stable") if frames else pd.DataFrame(columns=["Row", "ID", "Category", "Detail"])
+        return findings, suspicious
+
+    def iter_chunks(self, chunks):
+        """包装 iter_sheet_chunks：为每块补充 _row (行号) 与 _send (是否送审) 两列，并落盘预检结果。"""
+        if not self.findings_path:
+            yield from self._iter_checked(chunks, None)
             return
-        
-        # 开启新线程防止界面卡死
-        threading.Thread(target=self.run_audit, daemon=True).start()
+        with open(self.findings_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Row", "ID", "Category", "Detail"])
+            yield from self._iter_checked(chunks, writer)
+
+    def _iter_checked(self, chunks, writer):
+        row = 1
+        for chunk in chunks:
+            n = len(next(iter(chunk.values()), []))
+            if n == 0:  # 只有表头的表格：空列会被 pandas 推断成 float，没有可检查的行，直接跳过
+                continue
+            df = pd.DataFrame({
+                "Row": range(row, row + n),
+                "ID": [_cell(v) or "N/A" for v in chunk.get("ID", ["N/A"] * n)],
+                "Source": pd.Series([_cell(v) for v in chunk.get("Source", [""] * n)], dtype=object),
+                "Target": pd.Series([_cell(v) for v in chunk.get("Target", [""] * n)], dtype=object),
+            })
+            findings, suspicious = self.check(df, chunk.get("_src_features"))
+            if writer:
+                writer.writerows(findings.itertuples(index=False, name=None))
+
+            empty = df["Target"].str.strip() == ""
+            tm_hit = ~empty & (df["Source"] + "\x00" + df["Target"]).isin(self.tm_pairs)
+            send = ~empty & ~tm_hit
+            if self.known_hashes is not None:
+                contexts = [_cell(v) for v in chunk.get("Context", [""] * n)]
+                unchanged = pd.Series(self._index_rows(df, contexts), index=df.index)
+                self.skipped["unchanged"] += int((send & unchanged).sum())
+                send &= ~unchanged
+            if self.only_suspicious:
+                self.skipped["clean"] += int((send & ~suspicious).sum())
+                send &= suspicious
+            self.skipped["empty"] += int(empty.sum())
+            self.skipped["tm"] += int(tm_hit.sum())
+            self.sent += int(send.sum())
+            self.rows += n
+            row += n
+
+            chunk = dict(chunk)
+            chunk["_row"] = df["Row"].tolist()
+            chunk["_send"] = send.tolist()
+            yield chunk
+
+    def _index_rows(self, df, contexts):
+        """记录本块各行的哈希，返回与上一版相比未变化的掩码 (重复 ID 一律视为变化)。"""
+        unchanged = []
+        for row, row_id, source, target, context in zip(df["Row"], df["ID"], df["Source"], df["Target"], contexts):
+            row_hash = fingerprint(f"{source}\x00{target}\x00{context}")
+            if row_id == "N/A" or row_id in self.row_index or row_id in self.duplicate_ids:
+                self.duplicate_ids.add(row_id)
+                self.row_index.pop(row_id, None)
+                unchanged.append(False)
+                continue
+            self.row_index[row_id] = (row, row_hash)
+            previous = self.known_hashes.get(row_id)
+            if previous is None:
+                self.changed["new"] += 1
+            elif previous != row_hash:
+                self.changed["modified"] += 1
+            unchanged.append(previous == row_hash)
+        return unchanged
+
+    def summary(self):
+        found = "、".join(f"{k} {v}" for k, v in self.counts.items()) or "无"
+        skipped = sum(self.skipped.values())
+        text = (f"🧪 预检 {self.rows} 行，发现问题：{found}；送审 {self.sent} 行，跳过 {skipped} 行 "
+                f"(TM 精确匹配 {self.skipped['tm']}、空译文 {self.skipped['empty']}、无可疑 {self.skipped['clean']}")
+        if self.known_hashes is not None:
+            text += f"、未变化 {self.skipped['unchanged']}"
+        return text + ")"
+
+
+_DIGITS_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _template(text):
+    """模板归一化：数字统一为 #，连续空白合并，用于识别 "药水 1 / 药水 2" 这类只有编号不同的文本。"""
+    return _SPACES_RE.sub(" ", _DIGITS_RE.sub("#", text)).strip().lower()
+
+
+def _numbers_match(source, target):
+    """原文与译文中的数字 (不计顺序) 是否一致；语序调整不影响，"5" 译成 "50" 则不一致。"""
+    return sorted(_DIGITS_RE.findall(source)) == sorted(_DIGITS_RE.findall(target))
+
+
+class TextClusterer:
+    """送审前的重复 / 近似重复聚类：每簇只把第一次出现的行 (代表行) 送给模型，其余成员沿用代表行的结论。
+
+    mode 逐级放宽：
+        exact     原文 + 译文完全相同
+        template  数字、空白归一后相同 (物品名带编号、重复任务句式)
+        near      再加 MinHash/LSH：归一化文本的 3-gram 集合 Jaccard 相似度 ≥ threshold
+    模板 / 近似聚类会抹掉数字差异，因此原文与译文数字不一致的行 ("获得 5 金币" / "Get 50 gold") 既不并入、
+    也不作为代表行，单独送审，避免数字错误沿用代表行的结论。
+    以块为单位流式处理 (包装 PreChecker.iter_chunks 的输出)，只改写 _send 掩码，内存只保存每簇的键与签名。
+    """
+
+    MODES = ["off", "exact", "template", "near"]
+
+    def __init__(self, mode="exact", threshold=NEAR_DUP_THRESHOLD, perms=MINHASH_PERMS, bands=LSH_BANDS):
+        self.mode = mode
+        self.threshold = threshold
+        self.bands = bands
+        self.band_rows = perms // bands
+        rng = np.random.default_rng(20240521)  # 固定种子，同一文件每次聚类结果一致
+        self._a = rng.integers(1, 1 << 32, perms, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 32, perms, dtype=np.uint64)
+        self.keys = {}        # 精确 / 模板键 → 代表行
+        self.buckets = {}     # (band, 签名片段) → 代表行
+        self.signatures = {}  # 代表行 → MinHash 签名
+        self.members = {}     # 代表行 → [(成员行, 成员 ID)]
+        self.row_cluster = {}  # 行号 → 簇 ID (只记录多于一行的簇)
+        self.counts = {"exact": 0, "template": 0, "near": 0}
+
+    @property
+    def clustered(self):
+        return sum(self.counts.values())
+
+    def _join(self, rep_row, row, row_id, how):
+        self.members.setdefault(rep_row, []).append((row, row_id))
+        cluster_id = f"C{rep_row}"
+        self.row_cluster[rep_row] = self.row_cluster[row] = cluster_id
+        self.counts[how] += 1
+
+    def _signatures(self, texts, block=1000):
+        """整块文本的 MinHash 签名 (texts × perms) 及是否有 3-gram 的掩码，按 block 行分段计算以限制临时内存。"""
+        parts = [self._block_signatures(texts[i:i + block]) for i in range(0, len(texts), block)]
+        return np.vstack([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def _block_signatures(self, texts):
+        """3-gram 哈希与按行取最小值均为 numpy 向量运算。"""
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        codes = np.frombuffer("".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32).astype(np.uint64)
+        owners = np.repeat(np.arange(len(texts)), lengths)
+        starts = np.flatnonzero(owners[:-2] == owners[2:]) if len(codes) > 2 else np.empty(0, dtype=np.int64)
+        shingles = ((codes[starts] * np.uint64(1000003) ^ codes[starts + 1]) * np.uint64(1000003) ^ codes[starts + 2]) & np.uint64(0xFFFFFFFF)
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) & np.uint64(0xFFFFFFFF)
+        counts = np.bincount(owners[starts], minlength=len(texts)) if len(starts) else np.zeros(len(texts), dtype=np.int64)
+        signatures = np.full((len(texts), len(self._a)), np.uint64(0xFFFFFFFF), dtype=np.uint64)
+        has = counts > 0
+        if has.any():
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            signatures[has] = np.minimum.reduceat(hashed, offsets[has], axis=1).T
+        return signatures, has
+
+    def _near_match(self, signature):
+        for band in range(self.bands):
+            key = (band, signature[band * self.band_rows:(band + 1) * self.band_rows].tobytes())
+            rep_row = self.buckets.get(key)
+            if rep_row is not None and np.mean(self.signatures[rep_row] == signature) >= self.threshold:
+                return rep_row
+        return None
+
+    def _register(self, row, signature):
+        self.signatures[row] = signature
+        for band in range(self.bands):
+            self.buckets.setdefault((band, signature[band * self.band_rows:(band + 1) * self.band_rows].tobytes()), row)
+
+    def iter_chunks(self, chunks):
+        for chunk in chunks:
+            n = len(next(iter(chunk.values()), []))
+            send = list(chunk.get("_send", [True] * n))
+            rows = chunk.get("_row", range(n))
+            ids = chunk.get("ID", ["N/A"] * n)
+            sources = chunk.get("Source", [""] * n)
+            targets = chunk.get("Target", [""] * n)
+            pending = [i for i in range(n) if send[i]]
+            texts = {i: f"{_cell(sources[i])}\x00{_cell(targets[i])}" for i in pending}
+            signatures = has_signature = None
+            if self.mode == "near" and pending:
+                signatures, has_signature = self._signatures([_template(texts[i]) for i in pending])
+            for k, i in enumerate(pending):
+                row, row_id = rows[i], _cell(ids[i]) or "N/A"
+                key = hashlib.blake2b(texts[i].encode("utf-8"), digest_size=8).digest()
+                rep_row, how = self.keys.get(key), "exact"
+                fuzzy = self.mode in ("template", "near") and _numbers_match(_cell(sources[i]), _cell(targets[i]))
+                if rep_row is None and fuzzy:
+                    template_key = b"t" + hashlib.blake2b(_template(texts[i]).encode("utf-8"), digest_size=8).digest()
+                    rep_row, how = self.keys.get(template_key), "template"
+                if rep_row is None and fuzzy and self.mode == "near" and has_signature[k]:
+                    rep_row, how = self._near_match(signatures[k]), "near"
+                if rep_row is not None:
+                    send[i] = False
+                    self._join(rep_row, row, row_id, how)
+                    continue
+                self.keys[key] = row
+                if fuzzy:
+                    self.keys.setdefault(template_key, row)
+                if fuzzy and self.mode == "near" and has_signature[k]:
+                    self._register(row, signatures[k])
+            chunk = dict(chunk)
+            chunk["_send"] = send
+            yield chunk
+
+    def propagate(self, issues):
+        """把代表行的 AI 问题复制给同簇成员 (来源标为 "AI (同簇)")。"""
+        copies = []
+        for issue in issues:
+            for row, row_id in self.members.get(issue.row, ()):
+                copies.append(AuditIssue(row, row_id, issue.issue, issue.suggestion, issue.category, "AI (同簇)"))
+        return copies
+
+    def summary(self):
+        return (f"🧬 重复 / 相似文本聚类：{self.clustered} 行并入 {len(self.members)} 个簇，只审代表行 "
+                f"(完全相同 {self.counts['exact']}、模板相同 {self.counts['template']}、近似 {self.counts['near']})")
+
+
+_WIDE_CHAR_RE = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 字 1 token，其余约 4 字符 1 token。"""
+    wide = len(_WIDE_CHAR_RE.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def format_batch_rows(ids, sources, targets):
+    return "\n".join(f"{i} | {s} | {t}" for i, s, t in zip(ids, sources, targets))
+
+
+@dataclass
+class RowBatch:
+    rows: list = field(default_factory=list)     # 行号 (从 1 开始，预检跳过的行不在其中)
+    ids: list = field(default_factory=list)
+    sources: list = field(default_factory=list)
+    targets: list = field(default_factory=list)
+    term_hits: dict = field(default_factory=dict)  # 术语行号 -> 出现次数
+    est_tokens: int = 0
+
+    @property
+    def start(self):
+        return min(self.rows)  # 局部性重排后批次内行号不一定递增
+
+    @property
+    def end(self):
+        return max(self.rows)
+
+
+def iter_row_batches(chunks, glossary_index=None, token_budget=TOKEN_BUDGET,
+                     min_rows=MIN_BATCH_ROWS, max_rows=MAX_BATCH_ROWS, chunk_ticks=False):
+    """按 token 预算把列块装箱成批次 (RowBatch)。
+
+    每行的成本 = 该行文本的估算 token + 新命中术语条目的估算 token；
+    累计超过预算且已有 min_rows 行时截断，任何情况下不超过 max_rows 行。
+    块中带 _send 掩码 (见 PreChecker) 时只打包需要送审的行。
+    chunk_ticks=True 时每处理完一个块额外产出 None，调用方可据此按块同步推进多个生成器。
+    """
+    base_tokens = estimate_tokens(AUDIT_PROMPT_TEMPLATE)
+
+    def term_cost(batch, hits):
+        if len(batch.term_hits) >= GLOSSARY_MAX_TERMS:
+            return 0
+        return sum(glossary_index.line_tokens[t] for t in hits if t not in batch.term_hits)
+
+    batch = RowBatch(est_tokens=base_tokens)
+    next_row = 1
+    for chunk in chunks:
+        n = len(next(iter(chunk.values()), []))
+        ids = chunk.get("ID", ["N/A"] * n)
+        sources = chunk.get("Source", [""] * n)
+        targets = chunk.get("Target", [""] * n)
+        row_numbers = chunk.get("_row", range(next_row, next_row + n))
+        send_mask = chunk.get("_send", [True] * n)
+        shared_hits = chunk.get("_hits")  # 多语言扇出时原文术语匹配只做一次 (见 annotate_source_chunks)
+        next_row += n
+        for i, (row, send, row_id, source, target) in enumerate(zip(row_numbers, send_mask, ids, sources, targets)):
+            if not send:
+                continue
+            row_id, source, target = _cell(row_id) or "N/A", _cell(source), _cell(target)
+            row_cost = estimate_tokens(f"{row_id} | {source} | {target}") + 1
+            if not glossary_index:
+                hits = {}
+            else:
+                hits = shared_hits[i] if shared_hits is not None else glossary_index.match(source)
+
+            if batch.ids and (len(batch.ids) >= max_rows or (
+                    len(batch.ids) >= min_rows and batch.est_tokens + row_cost + term_cost(batch, hits) > token_budget)):
+                yield batch
+                batch = RowBatch(est_tokens=base_tokens)
+
+            batch.est_tokens += row_cost + term_cost(batch, hits)
+            batch.rows.append(row)
+            batch.ids.append(row_id)
+            batch.sources.append(source)
+            batch.targets.append(target)
+            for t, c in hits.items():
+                batch.term_hits[t] = batch.term_hits.get(t, 0) + c
+        if chunk_ticks:
+            yield None
+    if batch.ids:
+        yield batch
+
+
+class AhoCorasick:
+    """多模式串匹配自动机：一次线性扫描找出文本中出现的全部模式串 (调用方负责统一大小写)。"""
+
+    def __init__(self):
+        # Trie: goto[状态][字符] -> 状态；fail 为失配指针；out[状态] 为在此结束的 (模式串长度, 值)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern, value):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def iter_matches(self, text):
+        """逐个产出 (结束位置 (不含), 模式串长度, 值)。"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for pos, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in out[state]:
+                yield pos, length, value
+
+
+def id_prefix(row_id):
+    """ID 的分组前缀：去掉最后一个分隔符 (. _ - / :) 之后的部分，没有分隔符时去掉末尾数字。"""
+    m = _ID_PREFIX_RE.match(row_id)
+    return m.group(1) if m else row_id.rstrip("0123456789")
+
+
+class LocalityPacker:
+    """分批前的局部性重排：把同组的行排到一起，让同一界面 / 同一剧情的文本落在同一请求里，
+    每批注入的术语更少，模型也能看到相关上下文。
+
+    group_by 为 prefix (ID 前缀，见 id_prefix)、context (Context 列) 或任意列名 (如 Screen / Category)。
+    包装 PreChecker / TextClusterer 之后的块流：攒够 window_rows 个待送审行 (或读完全表) 时输出一个重排后的块，
+    组按首次出现的顺序排列，组内保持原顺序；其余输入块以空块代替，扇出时各语言仍按块同步推进。
+    每次重排都按原顺序和重排后的顺序各模拟一次分批，summary() 报告每行 token 与请求数的变化。
+    """
+
+    def __init__(self, group_by, glossary_index=None, token_budget=TOKEN_BUDGET, min_rows=MIN_BATCH_ROWS,
+                 max_rows=MAX_BATCH_ROWS, window_rows=PACK_WINDOW_ROWS):
+        self.group_by = group_by
+        self.glossary_index = glossary_index
+        self.batch_args = (token_budget, min_rows, max_rows)
+        self.window_rows = window_rows
+        self.groups = 0
+        self.missing_column = False
+        self.stats = {"rows": 0, "file_requests": 0, "file_tokens": 0, "packed_requests": 0, "packed_tokens": 0}
+
+    def _keys(self, chunk, n):
+        if self.group_by == "prefix":
+            return [id_prefix(_cell(v)) for v in chunk.get("ID", [""] * n)]
+        column = "Context" if self.group_by == "context" else self.group_by
+        names = {name.lower(): name for name in chunk if not name.startswith("_")}
+        if column.lower() not in names:
+            self.missing_column = True
+            return [""] * n
+        return [_cell(v) for v in chunk[names[column.lower()]]]
+
+    def _simulate(self, chunk):
+        requests = tokens = 0
+        for batch in iter_row_batches([chunk], self.glossary_index, *self.batch_args):
+            requests += 1
+            tokens += batch.est_tokens
+        return requests, tokens
+
+    def _flush(self, buffer):
+        keys = buffer.pop("_key")
+        first_seen = {}
+        for key in keys:
+            first_seen.setdefault(key, len(first_seen))
+        self.groups += len(first_seen)
+        order = sorted(range(len(keys)), key=lambda i: (first_seen[keys[i]], i))
+        packed = {name: [values[i] for i in order] for name, values in buffer.items()}
+        stats = self.stats
+        stats["rows"] += len(keys)
+        for prefix, chunk in (("file", buffer), ("packed", packed)):
+            requests, tokens = self._simulate(chunk)
+            stats[f"{prefix}_requests"] += requests
+            stats[f"{prefix}_tokens"] += tokens
+        return packed
+
+    def iter_chunks(self, chunks):
+        columns = ("ID", "Source", "Target", "_row", "_hits", "_key")
+        buffer = {name: [] for name in columns}
+        for chunk in chunks:
+            n = len(next(iter(chunk.values()), []))
+            send = chunk.get("_send", [True] * n)
+            keep = [i for i in range(n) if send[i]]
+            sources = chunk.get("Source", [""] * n)
+            if chunk.get("_hits") is not None:
+                hits = chunk["_hits"]
+            elif self.glossary_index:
+                hits = {i: self.glossary_index.match(_cell(sources[i])) for i in keep}
+            else:
+                hits = {i: {} for i in keep}
+            keys = self._keys(chunk, n)
+            for name, values in (("ID", chunk.get("ID", ["N/A"] * n)), ("Source", sources),
+                                 ("Target", chunk.get("Target", [""] * n)), ("_row", chunk["_row"]),
+                                 ("_hits", hits), ("_key", keys)):
+                buffer[name].extend(values[i] for i in keep)
+            if len(buffer["_key"]) >= self.window_rows:
+                yield self._flush(buffer)
+                buffer = {name: [] for name in columns}
+            else:
+                yield {}  # 空块：只推进分批器的块计数
+        if buffer["_key"]:
+            yield self._flush(buffer)
+
+    def summary(self):
+        s = self.stats
+        if not s["rows"]:
+            return f"🧲 按 {self.group_by} 重排：没有待送审的行"
+        text = (f"🧲 按 {self.group_by} 重排为 {self.groups} 组：请求数 {s['file_requests']} → {s['packed_requests']}，"
+                f"每行 ≈{s['file_tokens'] / s['rows']:.1f} → {s['packed_tokens'] / s['rows']:.1f} tokens (相对原文件顺序)")
+        if self.missing_column:
+            text += f"\n⚠️ 表中没有 {self.group_by} 列，该列缺失的块按原顺序分批"
+        return text
+
+
+class GlossaryIndex:
+    """术语表索引：在原文术语上构建 Aho-Corasick 自动机，对批次原文做一次线性扫描，
+    只取出真正出现过的术语条目注入 Prompt，而不是每批都粘贴整张术语表。
+    """
+
+    def __init__(self, header, rows, source_col=0):
+        self.columns = list(header)
+        self.rows = rows
+        self.source_col = source_col
+        self.header = " | ".join(header)
+        self.lines = [" | ".join(row) for row in rows]
+        self.line_tokens = [estimate_tokens(line) + 1 for line in self.lines]
+        self._ac = AhoCorasick()
+        self._term_len = {}
+        for idx, row in enumerate(rows):
+            term = row[source_col].lower() if source_col < len(row) else ""
+            if term:
+                self._ac.add(term, idx)
+                self._term_len[idx] = len(term)
+        self._ac.build()
+
+    @classmethod
+    def from_dataframe(cls, df):
+        columns = [str(c) for c in df.columns]
+        source_col = columns.index("Source") if "Source" in columns else 0
+        rows = [[_cell(v).strip() for v in values] for values in df.itertuples(index=False, name=None)]
+        return cls(columns, rows, source_col)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def term(self, idx):
+        return self.rows[idx][self.source_col]
+
+    def match(self, text):
+        """返回 {术语行号: 出现次数}。"""
+        hits = {}
+        for _, _, idx in self._ac.iter_matches(text.lower()):
+            hits[idx] = hits.get(idx, 0) + 1
+        return hits
+
+    def terms(self, text):
+        """原文中出现的术语行号；被更长术语完整覆盖的短术语不计 ("火焰之剑" 中的 "火焰")。"""
+        spans = sorted((end - length, -end, idx) for end, length, idx in self._ac.iter_matches(text.lower()))
+        found, reach, last = [], -1, None
+        for start, neg_end, idx in spans:
+            end = -neg_end
+            if end > reach or (start, end) == last:  # 后者为原文相同的重复术语行
+                found.append(idx)
+                reach, last = max(reach, end), (start, end)
+        return list(dict.fromkeys(found))
+
+    def select(self, hits, max_terms=GLOSSARY_MAX_TERMS):
+        """从 match() 的命中结果中选出要注入的术语，返回 (术语行号列表, 是否因超出上限被截断)。"""
+        ranked = sorted(hits, key=lambda i: (-hits[i], -self._term_len[i], i))
+        truncated = len(ranked) > max_terms
+        return sorted(ranked[:max_terms]), truncated
+
+    def render(self, indices):
+        if not indices:
+            return "（本批无相关术语）"
+        return "\n".join([self.header] + [self.lines[i] for i in indices])
+
+
+def term_variants(form, lang):
+    """术语译法的词形变体，返回 [(小写变体, 是否允许后接任意字母)]。
+
+    GLOSSARY_SUFFIXES 中的语言枚举常见复数 / 变格词尾 (英语另加 y → ies)；
+    GLOSSARY_STEM_ENDINGS 中的语言按词干前缀匹配；日语、中文按子串匹配。
+    """
+    base = form.strip().lower()
+    if not base:
+        return []
+    if lang in HAN_TARGET_LANGUAGES:
+        return [(base, True)]
+    if lang in GLOSSARY_STEM_ENDINGS:
+        endings = GLOSSARY_STEM_ENDINGS[lang]
+        stems = [base]
+        if base[-1] in endings and len(base) > 3:
+            stems.append(base[:-1] + endings[base[-1]])
+        return [(stem, True) for stem in stems]
+    variants = [base] + [base + suffix for suffix in GLOSSARY_SUFFIXES.get(lang, [])]
+    if lang == "English" and base.endswith("y"):
+        variants.append(base[:-1] + "ies")
+    return [(v, False) for v in dict.fromkeys(variants)]
+
+
+def glossary_target_column(columns, source_col, target_column="Target", target_lang="English"):
+    """在术语表中找与译文列对应的译法列：按列名、语言名或语言代码匹配，其次 Target / Translation / 译文，
+    术语表只有两列时取第二列。找不到时返回 None。"""
+    lowered = [str(c).strip().lower() for c in columns]
+    codes = [code for code, name in LANGUAGE_CODES.items() if name == target_lang]
+    for name in [target_column, target_lang, *codes, "Target", "Translation", "译文"]:
+        if name and name.lower() in lowered and lowered.index(name.lower()) != source_col:
+            return lowered.index(name.lower())
+    if len(columns) == 2:
+        return 1 - source_col
+    return None
+
+
+class GlossaryEnforcer:
+    """本地术语一致性检查，不调用模型。
+
+    原文侧沿用 GlossaryIndex 的自动机找出出现的术语 (被更长术语覆盖的不计)；译文侧把全部可用 / 禁用译法
+    及其词形变体 (见 term_variants) 编进另一个 Aho-Corasick 自动机，每行译文只扫描一遍。
+    原文出现某术语、而译文既没有任何可用译法时报告"未按术语表翻译"，出现禁用译法时报告"禁用译法"。
+    可用译法写在与译文列对应的列中，多个译法用 ; 或 / 分隔；禁用译法写在 "<列名>_Forbidden"
+    (或 "Forbidden_<列名>"；没有时使用通用的 "Forbidden" 列) 中。
+    """
+
+    def __init__(self, glossary_index, column, target_lang="English", forbidden_column=None):
+        self.index = glossary_index
+        self.target_lang = target_lang
+        self.word_boundary = target_lang not in HAN_TARGET_LANGUAGES
+        self.approved = {}   # 术语行号 -> 可用译法 (展示用)
+        self.variants = 0
+        self._ac = AhoCorasick()
+        for idx, row in enumerate(glossary_index.rows):
+            allowed = [f for f in GLOSSARY_SPLIT_RE.split(row[column]) if f] if column < len(row) else []
+            if not allowed or not glossary_index.term(idx):
+                continue
+            self.approved[idx] = " / ".join(allowed)
+            forbidden = []
+            if forbidden_column is not None and forbidden_column < len(row):
+                forbidden = [f for f in GLOSSARY_SPLIT_RE.split(row[forbidden_column]) if f]
+            for forms, bad in ((allowed, False), (forbidden, True)):
+                for form in forms:
+                    for variant, open_end in term_variants(form, target_lang):
+                        self._ac.add(variant, (idx, bad, open_end))
+                        self.variants += 1
+        self._ac.build()
+
+    @classmethod
+    def for_target(cls, glossary_index, target_column="Target", target_lang="English"):
+        """按译文列找到术语表中的译法列与禁用列并编译；术语表中没有对应列时返回 None。"""
+        columns = glossary_index.columns
+        column = glossary_target_column(columns, glossary_index.source_col, target_column, target_lang)
+        if column is None:
+            return None
+        lowered = [str(c).strip().lower() for c in columns]
+        name = lowered[column]
+        forbidden = next((lowered.index(c) for c in (f"{name}_forbidden", f"forbidden_{name}", f"{name} forbidden", "forbidden")
+                          if c in lowered), None)
+        return cls(glossary_index, column, target_lang, forbidden)
+
+    def __len__(self):
+        return len(self.approved)
+
+    def _is_word(self, text, start, end, open_end):
+        if not self.word_boundary:
+            return True
+        if start > 0 and text[start - 1].isalnum():
+            return False
+        return open_end or end >= len(text) or not text[end].isalnum()
+
+    def check(self, terms, target):
+        """terms 为原文中出现的术语行号 (GlossaryIndex.terms)，返回问题描述列表。"""
+        terms = [idx for idx in terms if idx in self.approved]
+        if not terms or not target.strip():
+            return []
+        text = target.lower()
+        found, forbidden = set(), {}
+        for end, length, (idx, bad, open_end) in self._ac.iter_matches(text):
+            start = end - length
+            if not self._is_word(text, start, end, open_end):
+                continue
+            if bad:
+                forbidden.setdefault(idx, target[start:end] if len(text) == len(target) else text[start:end])
+            else:
+                found.add(idx)
+        problems = []
+        for idx in terms:
+            if idx in forbidden:
+                problems.append(f"「{self.index.term(idx)}」使用了禁用译法 {forbidden[idx]}，应为 {self.approved[idx]}")
+            elif idx not in found:
+                problems.append(f"「{self.index.term(idx)}」未按术语表译为 {self.approved[idx]}")
+        return problems
+
+
+@dataclass
+class AuditIssue:
+    row: int                # 行号 (从 1 开始)；无法归属到具体行时为 0
+    id: str
+    issue: str
+    suggestion: str = ""
+    category: str = ""
+    origin: str = "AI"      # AI / 预检
+    cluster: str = ""       # 重复 / 相似文本聚类的簇 ID (见 TextClusterer)
+
+
+_ISSUE_SPLIT_RE = re.compile(r"\s*[|｜\t]\s*")
+_LIST_MARK_RE = re.compile(r"^(?:[-*•]|\d+[.)、])\s+")
+_CATEGORY_RE = re.compile(r"^[\[【]([^\]】]{1,20})[\]】]\s*")
+_ID_TOKEN_RE = re.compile(r"[\w.\-/]+")
+_REPAIR_PREFIX_RE = re.compile(r"^\s*(?:行|号|row)?\s*[:：,，\-]?\s*", re.IGNORECASE)
+
+
+def parse_audit_response(text, id_rows):
+    """把模型输出的 "ID | 问题 | 建议" 文本解析为 AuditIssue 列表，返回 (issues, 无法归属的行)。
+
+    id_rows 为本批 {ID: 行号}。容错：忽略代码块标记、Markdown 表头/分隔行和列表符号，
+    全角竖线与 Tab 同样视为分隔符。修复：首列不是本批 ID 时，在整行中查找本批出现过的 ID 重新切分。
+    """
+    issues, leftovers = [], []
+    for raw in text.splitlines():
+        line = _LIST_MARK_RE.sub("", raw.strip().strip("`").strip())
+        if not line or set(line) <= set("|｜-:= "):
+            continue
+        parts = [p.strip(" *") for p in _ISSUE_SPLIT_RE.split(line.strip("|｜ "))]
+        row_id = parts[0]
+        if row_id.upper() == "ID":
+            continue  # 表头
+        if row_id not in id_rows:
+            known = [t for t in _ID_TOKEN_RE.findall(line) if t in id_rows]
+            if not known:
+                leftovers.append(raw.strip())
+                continue
+            row_id = max(known, key=len)
+            rest = _REPAIR_PREFIX_RE.sub("", line.split(row_id, 1)[1])
+            parts = [row_id] + [p.strip(" *:：") for p in _ISSUE_SPLIT_RE.split(rest) if p.strip(" *:：")]
+        issue = parts[1] if len(parts) > 1 else ""
+        if not issue:
+            leftovers.append(raw.strip())
+            continue
+        category = ""
+        match = _CATEGORY_RE.match(issue)
+        if match:
+            category, issue = match.group(1), issue[match.end():]
+        issues.append(AuditIssue(id_rows[row_id], row_id, issue, " | ".join(parts[2:]), category))
+    return issues, leftovers
+
+
+def load_precheck_issues(path):
+    issues = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for item in csv.DictReader(f):
+            issues.append(AuditIssue(int(item["Row"]), item["ID"], item["Detail"], "", item["Category"], "预检"))
+    return issues
+
+
+def _xlsx_value(value):
+    """openpyxl 不接受的控制字符会导致整本写入失败，写入前剔除。"""
+    if isinstance(value, str):
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        return ILLEGAL_CHARACTERS_RE.sub("", value)
+    return value
+
+
+def write_merged_workbook(input_path, issue_groups, out_path, cluster_groups=None):
+    """再次流式读取原表，按行号把问题回填为新列，并高亮有问题的行，写出 xlsx。
+
+    issue_groups 为 {译文列: {行号: [AuditIssue]}}；只有 Target 一列时问题列名不加前缀，
+    多语言时每个译文列各占一组 "<列名> LQA ..." 问题列。cluster_groups ({译文列: {行号: 簇 ID}})
+    非空时每组再加一列 CLUSTER_COLUMN，标出重复 / 相似文本所在的簇。
+    使用 openpyxl 的 write-only 模式逐块写出，内存只保存问题记录本身。返回写出的问题行数。
+    """
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import PatternFill
+
+    fill = PatternFill("solid", fgColor=ISSUE_FILL_COLOR)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("LQA")
+    prefixed = list(issue_groups) != ["Target"]
+    group_columns = ISSUE_COLUMNS + ([CLUSTER_COLUMN] if cluster_groups else [])
+    extra_columns = [f"{target} {name}" if prefixed else name for target in issue_groups for name in group_columns]
+    cluster_groups = cluster_groups or {}
+    row = 1
+    flagged = 0
+    for chunk in iter_sheet_chunks(input_path):
+        columns = list(chunk.keys())
+        if row == 1:
+            ws.append(columns + extra_columns)
+        for values in zip(*chunk.values()):
+            hits = {target: groups[row] for target, groups in issue_groups.items() if row in groups}
+            clusters = {target: groups[row] for target, groups in cluster_groups.items() if row in groups}
+            if not hits and not clusters:
+                ws.append([_xlsx_value(v) for v in values])
+                row += 1
+                continue
+            flagged += bool(hits)
+            extra = []
+            for target in issue_groups:
+                found = hits.get(target, [])
+                extra += [
+                    "\n".join(dict.fromkeys(i.origin for i in found)),
+                    "\n".join(i.category for i in found if i.category),
+                    "\n".join(i.issue for i in found),
+                    "\n".join(i.suggestion for i in found if i.suggestion),
+                ]
+                if cluster_groups:
+                    extra.append(clusters.get(target, ""))
+            highlighted = {target for target in hits}
+            highlighted |= {f"{target} {name}" if prefixed else name for target in hits for name in ISSUE_COLUMNS}
+            cells = []
+            for name, value in zip(columns + extra_columns, list(values) + extra):
+                cell = WriteOnlyCell(ws, value=_xlsx_value(value))
+                if name in highlighted:
+                    cell.fill = fill
+                cells.append(cell)
+            ws.append(cells)
+            row += 1
+    wb.save(out_path)
+    return flagged
+
+
+def export_issues(issues, base_path):
+    """导出问题记录为 CSV，装有 pyarrow 时同时导出 Parquet。返回写出的文件列表。"""
+    df = pd.DataFrame([vars(i) for i in issues], columns=["row", "id", "origin", "category", "issue", "suggestion", "cluster"])
+    paths = [base_path + ".csv"]
+    df.to_csv(paths[0], index=False, encoding="utf-8-sig")
+    try:
+        df.to_parquet(base_path + ".parquet", index=False)
+        paths.append(base_path + ".parquet")
+    except ImportError:
+        pass
+    return paths
+
+
+class AuditJournal:
+    """断点续审日志，位于待审文件旁 (<文件名>.lqa_journal.jsonl，多语言扇出时每个译文列一份)。
+
+    每完成一批立即追加一行 JSON 并 fsync，键为 输入文件哈希 + 批次行号范围 + 批次内容键。
+    中途崩溃后重跑同一文件时，已完成的批次直接取日志中的原始响应，最终报告与一次跑完完全一致。
+    全部批次成功后日志自动删除；仍有失败批次时保留，下次只补跑失败部分。
+    """
+
+    def __init__(self, input_path, scope="Target"):
+        self.path = input_path + ("" if scope == "Target" else f".{scope}") + ".lqa_journal.jsonl"
+        self.file_hash = file_sha256(input_path)
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue  # 崩溃时写了一半的行
+                    if item.get("file") == self.file_hash:
+                        self.entries[(item["start"], item["end"], item["key"])] = item["response"]
+            with open(self.path, "rb+") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")  # 补齐半行，避免后续记录粘连
+        self.resumed = len(self.entries)
+
+    def get(self, start, end, key):
+        return self.entries.get((start, end, key))
+
+    def record(self, start, end, key, response):
+        line = json.dumps({"file": self.file_hash, "start": start, "end": end, "key": key, "response": response}, ensure_ascii=False)
+        with self._lock:
+            self.entries[(start, end, key)] = response
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def finish(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ProjectIndex:
+    """增量审计的项目索引 (SQLite)：记录上一版每行的哈希以及该行的 AI 问题。
+
+    scope 区分同一项目中的不同译文列。replace() 在一个事务内整体替换某个 scope 的内容，
+    因此上一版存在、本版已删除的行及其问题会被一并丢弃。
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS rows (scope TEXT, id TEXT, hash TEXT, PRIMARY KEY (scope, id));"
+            "CREATE TABLE IF NOT EXISTS findings (scope TEXT, id TEXT, category TEXT, issue TEXT, suggestion TEXT);"
+            "CREATE INDEX IF NOT EXISTS findings_scope_id ON findings (scope, id);"
+        )
+
+    def hashes(self, scope):
+        return dict(self._conn.execute("SELECT id, hash FROM rows WHERE scope = ?", (scope,)))
+
+    def carried_issues(self, scope, id_rows):
+        """取出 id_rows ({ID: 本版行号}) 中各行上一版的 AI 问题，行号换成本版行号。"""
+        issues = []
+        for row_id, category, issue, suggestion in self._conn.execute(
+                "SELECT id, category, issue, suggestion FROM findings WHERE scope = ?", (scope,)):
+            if row_id in id_rows:
+                issues.append(AuditIssue(id_rows[row_id], row_id, issue, suggestion, category, origin="AI (沿用)"))
+        return issues
+
+    def replace(self, scope, row_hashes, issues):
+        with self._conn:
+            self._conn.execute("DELETE FROM rows WHERE scope = ?", (scope,))
+            self._conn.execute("DELETE FROM findings WHERE scope = ?", (scope,))
+            self._conn.executemany("INSERT INTO rows VALUES (?, ?, ?)", ((scope, k, v) for k, v in row_hashes.items()))
+            self._conn.executemany("INSERT INTO findings VALUES (?, ?, ?, ?, ?)",
+                                   ((scope, i.id, i.category, i.issue, i.suggestion) for i in issues))
+
+    def close(self):
+        self._conn.close()
+
+
+class ResponseCache:
+    """按批次内容寻址的持久化响应缓存 (SQLite)。
+
+    键由端点 (后端 + base_url)、模型名、Prompt 模板、术语表指纹和批次原文共同决定，任一变化都会重新请求；
+    假模型 / 模拟服务器的结果因此不会被当成真实模型的结果复用。
+    超过 max_age_days 的条目以及超出 max_mb 时最久未访问的条目会在 evict() 时清理。
+    """
+
+    def __init__(self, path=CACHE_DB_FILE, max_age_days=CACHE_MAX_AGE_DAYS, max_mb=CACHE_MAX_MB):
+        self.max_age = max_age_days * 86400
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(endpoint, model_name, template, glossary_fp, batch_text):
+        return fingerprint(json.dumps([endpoint, model_name, template, glossary_fp, batch_text], ensure_ascii=False))
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """清理过期条目，再按最久未访问顺序裁剪到容量上限。返回删除条数。"""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                stale = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                removed += len(stale)
+            self._conn.commit()
+            return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def dispatch_batches(batches, send, max_workers=DEFAULT_WORKERS, on_done=None):
+    """用有界线程池并发发送批次，结果按原顺序返回。
+
+    batches 可以是惰性生成器：在途批次最多 2 * max_workers 个，读表与请求重叠进行，
+    不会把整张表一次性展开。单个批次失败不会中断整体：对应位置返回 None，
+    异常通过 on_done 回调交给调用方。on_done(已完成数, 批次序号, 结果, 异常或 None) 在调用线程中依次触发。
+    """
+    workers = max(1, max_workers)
+    results = {}
+    pending = {}
+    done = 0
+
+    def collect(return_when):
+        nonlocal done
+        finished, _ = wait(pending, return_when=return_when)
+        for future in finished:
+            idx = pending.pop(future)
+            error = None
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                results[idx] = None
+                error = e
+            done += 1
+            if on_done:
+                on_done(done, idx, results[idx], error)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx, batch in enumerate(batches):
+            pending[pool.submit(send, batch)] = idx
+            if len(pending) >= workers * 2:
+                collect(FIRST_COMPLETED)
+        while pending:
+            collect(FIRST_COMPLETED)
+    return [results[i] for i in range(len(results))]
+
+
+# ==============================================================================
+# 🧩 审计流程 (不依赖界面，命令行与 GUI 共用)
+# ==============================================================================
+
+@dataclass
+class AuditSettings:
+    model_name: str = MODEL_NAME
+    endpoint: str = "gemini"          # 响应缓存键中的端点标识 (见 endpoint_id)
+    max_workers: int = DEFAULT_WORKERS
+    target_lang: str = "English"
+    only_suspicious: bool = False
+    glossary_path: str = ""
+    tm_path: str = ""
+    token_budget: int = TOKEN_BUDGET
+    min_rows: int = MIN_BATCH_ROWS
+    max_rows: int = MAX_BATCH_ROWS
+    project_path: str = ""  # 非空时增量审计，只送审新增 / 变化的行
+    targets: list = field(default_factory=list)  # 多语言扇出的译文列 (见 resolve_targets)，为空时只审 Target 列
+    fonts: dict = field(default_factory=dict)  # {目标语言或 "" (通用): 字体文件}，用于像素宽度爆框检查
+    font_size: int = FONT_SIZE
+    layout_path: str = ""  # 布局表 (ID → 框宽 px)
+    max_width: int = 0  # 布局表中没有的 ID 使用的默认框宽 (px)，0 表示不检查
+    cluster_mode: str = CLUSTER_MODE  # 重复 / 相似文本聚类 (见 TextClusterer.MODES)
+    group_by: str = ""                # 分批前按 prefix / context / 列名重排 (见 LocalityPacker)
+    pack_window: int = PACK_WINDOW_ROWS  # 重排窗口 (待送审行数)
+    glossary_check: bool = True       # 用术语表在本地检查译法一致性 (见 GlossaryEnforcer)
+    prefix_cache: bool = False        # 说明 + 完整术语表作为固定前缀 (上下文缓存)，各批只发送行
+
+
+@dataclass
+class BatchSpec:
+    start: int
+    end: int
+    key: str
+    prompt: str
+    id_rows: dict           # {ID: 行号}，解析响应时用来回填行号
+    n_rows: int
+    est_tokens: int
+    n_terms: int = 0
+    truncated: bool = False
+    queued_at: float = 0.0  # 提交到线程池的时刻 (perf_counter)
+    trace: dict = None      # 发送阶段的遥测，解析后交给 Telemetry
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟额度，按秒匀速补充。acquire(n) 阻塞到令牌足够为止，返回等待秒数。"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)  # 单次超过容量时按满桶放行，避免永久阻塞
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveLimiter:
+    """AIMD 并发控制：出现限流时并发减半，连续成功 limit 次后并发 +1，范围 [1, max_limit]。"""
+
+    def __init__(self, max_limit):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
 
-    def run_audit(self):
-        api_key = self.api_entry.get()
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                    "InternalServerError", "GatewayTimeout", "RateLimitError", "FakeRateLimitError"}
+_THROTTLE_HINTS = ("429", "resource has been exhausted", "quota", "rate limit", "too many requests")
+
+
+def _error_status(error):
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle_error(error):
+    """429 / 配额耗尽类错误：需要退避并降低并发。"""
+    if _error_status(error) == 429 or type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError", "FakeRateLimitError"):
+        return True
+    message = str(error).lower()
+    return any(hint in message for hint in _THROTTLE_HINTS)
+
+
+def is_retryable_error(error):
+    """限流、服务端 5xx、超时和网络抖动可重试；参数错误、鉴权失败等直接失败。"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return (_error_status(error) in _RETRYABLE_STATUS or type(error).__name__ in _RETRYABLE_NAMES
+            or is_throttle_error(error))
+
+
+class RequestHedger:
+    """对冲请求：调用耗时超过最近 HEDGE_WINDOW 次的第 percentile 百分位仍未返回时，再发一个相同请求，
+    取先成功返回的结果。额外请求数不超过调用总数的 budget 比例，样本不足 min_samples 时不对冲。
+    落后的请求无法取消，在后台 (守护) 线程中跑完后丢弃结果，不会拖住进程退出。
+    阈值样本只取主请求自身的耗时：对冲先返回时主请求仍在后台跑完后再记录，
+    否则对冲胜出的短耗时会把阈值越拉越低，对冲越发越多。
+    """
+
+    def __init__(self, budget=HEDGE_BUDGET, percentile=HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES):
+        self.budget = budget
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.recent = deque(maxlen=HEDGE_WINDOW)
+        self.stats = {"calls": 0, "hedged": 0, "wins": 0, "denied": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _spawn(fn):
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def threshold(self):
+        with self._lock:
+            if len(self.recent) < self.min_samples:
+                return None
+            return _percentile(self.recent, self.percentile)
+
+    def _take_budget(self):
+        with self._lock:
+            if self.stats["hedged"] + 1 > self.budget * self.stats["calls"]:
+                self.stats["denied"] += 1
+                return False
+            self.stats["hedged"] += 1
+            return True
+
+    def _record(self, started, future):
+        """主请求完成时的回调：只记录成功请求的耗时。"""
+        if future.exception() is None:
+            with self._lock:
+                self.recent.append(time.perf_counter() - started)
+
+    def _finish(self, hedged=False, won=False):
+        with self._lock:
+            self.stats["wins"] += won
+        return hedged, won
+
+    def call(self, fn, before_hedge=None):
+        """执行 fn()，返回 (结果, 是否发出对冲, 对冲是否先返回)。before_hedge 在发出对冲前调用 (占用限流额度)。"""
+        with self._lock:
+            self.stats["calls"] += 1
+        started = time.perf_counter()
+        delay = self.threshold()
+        primary = self._spawn(fn)
+        primary.add_done_callback(partial(self._record, started))
+        if delay is None or wait([primary], timeout=delay).done or not self._take_budget():
+            result = primary.result()
+            return (result, *self._finish())
+        if before_hedge:
+            before_hedge()
+        hedge = self._spawn(fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f: f.exception() is not None):
+                if future.exception() is None:
+                    return (future.result(), *self._finish(True, future is hedge))
+        raise primary.exception()
+
+    def summary(self):
+        s, threshold = self.stats, self.threshold()
+        return (f"🪁 对冲请求 {s['hedged']} 次 (上限 {self.budget:.0%})，其中对冲先返回 {s['wins']} 次，"
+                f"预算不足未对冲 {s['denied']} 次，当前阈值 {'样本不足' if threshold is None else f'{threshold:.1f}s'}")
+
+
+class ModelClient:
+    """模型调用入口，负责限流调度。多个文件共享同一个 ModelClient 时，限额在全部文件间共享。
+
+    每次请求先从 RPM / TPM 两个令牌桶取令牌，再占用一个自适应并发名额；
+    可重试错误按指数退避 (带随机抖动) 重试，限流错误还会让并发上限减半，恢复后逐步回升。
+    """
+
+    def __init__(self, model, max_concurrency=DEFAULT_WORKERS, rpm=RPM_LIMIT, tpm=TPM_LIMIT, max_retries=MAX_RETRIES,
+                 hedge_budget=0.0):
+        self.model = model
+        self.hedger = RequestHedger(hedge_budget) if hedge_budget > 0 else None
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "rate_wait_s": 0.0, "limiter_wait_s": 0.0,
+                      "prefix_requests": 0, "prefix_bytes_saved": 0}
+        self.latencies = []  # 每次成功请求的耗时 (秒)
+        self.prefix_ttl_s = PREFIX_CACHE_TTL_S
+        self._prefixes = {}  # 前缀指纹 -> 绑定了该前缀的模型 (后端不支持时为 None)
+        self._prefix_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def gemini(cls, api_key, model_name=MODEL_NAME, max_concurrency=DEFAULT_WORKERS, **limits):
+        return cls(make_model("gemini", api_key, model_name), max_concurrency, **limits)
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    def _admit_hedge(self, cost):
+        """对冲请求同样占用 RPM / TPM 令牌 (不占并发名额，数量由对冲预算限制)。"""
+        waited = self.request_bucket.acquire(1) + self.token_bucket.acquire(cost)
+        self._count(requests=1, rate_wait_s=waited)
+
+    def _bind_prefix(self, prefix, scope=""):
+        """取 (或首次创建) 绑定了固定前缀的模型；后端没有 with_prefix() 时返回 None，由调用方把前缀拼进提示词。"""
+        key = fingerprint(prefix)
+        with self._prefix_lock:
+            if key not in self._prefixes:
+                bind = getattr(self.model, "with_prefix", None)
+                self._prefixes[key] = bind(prefix, self.prefix_ttl_s, scope) if bind else None
+            return self._prefixes[key]
+
+    def _prefix_saved(self, prefix, bound):
+        """本次请求节省的前缀字节：只有上下文缓存 (服务端缓存句柄) 生效时前缀才真正不发送。
+        拼进提示词、system 消息或 system_instruction 回退时前缀照常发送，记为 0；
+        服务端自动前缀缓存的复用量以响应中的 cached_tokens 为准，单独统计。"""
+        saved = len(prefix.encode("utf-8")) if getattr(bound, "cached", False) else 0
+        with self._stats_lock:
+            self.stats["prefix_requests"] += 1
+            self.stats["prefix_bytes_saved"] += saved
+        return saved
+
+    def generate(self, prompt, info=None, prefix=None, prefix_scope=""):
+        """发送请求并返回文本。传入 info 字典时写入本次调用的遥测：尝试次数、令牌桶等待、
+        并发名额等待 (limiter_wait_s，限流减半后往往是主要等待)、请求耗时与 token 数。
+
+        prefix 为固定前缀 (见 AUDIT_PREFIX_TEMPLATE)：后端支持时放进上下文缓存 / system 消息只发送后缀，
+        否则拼在提示词前面。prefix_scope 标识前缀的来源 (术语表文件)，用于清理同一来源的过期缓存。
+        """
+        model, bound = self.model, None
+        if prefix:
+            bound = self._bind_prefix(prefix, prefix_scope)
+            if bound is None:
+                prompt = prefix + "\n" + prompt
+            else:
+                model = bound
+        # 缓存命中的前缀同样计入 TPM 额度
+        cost = estimate_tokens(prompt) + (estimate_tokens(prefix) if bound is not None else 0) + RESPONSE_TOKEN_ALLOWANCE
+        info = {} if info is None else info
+        info.update(attempts=0, rate_wait_s=0.0, limiter_wait_s=0.0, request_s=0.0, prompt_tokens=None, output_tokens=None)
+        for attempt in range(self.max_retries + 1):
+            waited = self.request_bucket.acquire(1) + self.token_bucket.acquire(cost)
+            limit_started = time.perf_counter()
+            self.limiter.acquire()
+            sent_at = time.perf_counter()
+            throttled = False
+            info["attempts"] += 1
+            info["rate_wait_s"] += waited
+            info["limiter_wait_s"] += sent_at - limit_started
+            try:
+                self._count(requests=1, rate_wait_s=waited, limiter_wait_s=sent_at - limit_started)
+                if self.hedger:
+                    response, info["hedged"], info["hedge_won"] = self.hedger.call(
+                        partial(model.generate_content, prompt), partial(self._admit_hedge, cost))
+                else:
+                    response = model.generate_content(prompt)
+                elapsed = time.perf_counter() - sent_at
+                with self._stats_lock:
+                    self.latencies.append(elapsed)
+                info["request_s"] += elapsed
+                info["prompt_tokens"], info["output_tokens"], info["cached_tokens"] = response_usage(response)
+                if prefix:
+                    info["prefix_saved_bytes"] = self._prefix_saved(prefix, bound)
+                return response.text
+            except Exception as e:
+                info["request_s"] += time.perf_counter() - sent_at
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                throttled = is_throttle_error(e)
+                self._count(retries=1, throttled=int(throttled))
+            finally:
+                self.limiter.release(throttled)
+            # 退避期间不占并发名额
+            time.sleep(random.uniform(0.5, 1.0) * min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+
+    def summary(self):
+        s = self.stats
+        text = (f"🚦 实际请求 {s['requests']} 次，重试 {s['retries']} 次 (其中限流 {s['throttled']} 次)，"
+                f"令牌桶等待 {s['rate_wait_s']:.0f}s，并发名额等待 {s['limiter_wait_s']:.0f}s，当前并发上限 {self.limiter.limit}/{self.limiter.max_limit}")
+        if self.hedger:
+            text += "\n" + self.hedger.summary()
+        if self._prefixes:
+            if any(getattr(m, "cached", False) for m in self._prefixes.values()):
+                text += f"\n🧷 固定前缀 {len(self._prefixes)} 个 (上下文缓存)，{s['prefix_requests']} 次请求共少发送约 {s['prefix_bytes_saved'] / 1024:.0f} KB"
+            else:
+                text += (f"\n🧷 固定前缀 {len(self._prefixes)} 个 (随请求发送，服务端前缀缓存的复用量见 cached_tokens)，"
+                         f"共 {s['prefix_requests']} 次请求")
+        return text
+
+
+class FakeRateLimitError(Exception):
+    code = 429
+
+
+class FakeModel:
+    """本地假模型端点 (不联网)，用于在不消耗配额的情况下演练限流与重试逻辑。
+
+    按 throttle_rate 概率抛出 429，按 spike_rate 概率出现 spike_s 秒的延迟尖刺，
+    正常请求耗时在 latency_s 附近；tail_alpha 大于 0 时改为 latency_s × Pareto(tail_alpha) 的重尾分布
+    (alpha 越小尾部越长，1.2 时 P99 约为中位数的 30 倍)，用于演练对冲请求。响应为对批次前几行的固定格式问题。
+    """
+
+    def __init__(self, latency_s=0.5, throttle_rate=0.1, spike_rate=0.05, spike_s=8.0, seed=None, tail_alpha=0.0):
+        self.latency_s = latency_s
+        self.tail_alpha = tail_alpha
+        self.throttle_rate = throttle_rate
+        self.spike_rate = spike_rate
+        self.spike_s = spike_s
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            roll, spike, jitter = self._random.random(), self._random.random(), self._random.uniform(0.5, 1.5)
+            if self.tail_alpha > 0:
+                jitter = min(self._random.paretovariate(self.tail_alpha), HTTP_TIMEOUT_S / self.latency_s)
+        if roll < self.throttle_rate:
+            time.sleep(self.latency_s * 0.1)
+            raise FakeRateLimitError("429 Resource has been exhausted (e.g. check quota).")
+        time.sleep(self.spike_s if spike < self.spike_rate else self.latency_s * jitter)
+        return ModelResponse("\n".join(f"{row_id} | [Style/Tone] 语感生硬 (模拟) | 建议润色" for row_id in _prompt_row_ids(prompt)[:2]))
+
+
+class ModelResponse:
+    """与 Gemini SDK 响应对齐的最小接口：只需要 .text。"""
+
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage = usage or {}
+
+
+_PROMPT_ROW_RE = re.compile(r"^(\S+) \| ", re.MULTILINE)
+
+
+def _prompt_row_ids(prompt):
+    """从审计提示词中取出本批的行 ID (format_batch_rows 的 "ID | 原文 | 译文" 格式，跳过前面的术语表)。"""
+    return _PROMPT_ROW_RE.findall(prompt.rsplit("审核以下翻译", 1)[-1])
+
+
+class GeminiModel:
+    """Gemini SDK 的薄封装 (generate_content 原样透传)，with_prefix() 把固定前缀放进上下文缓存。"""
+
+    def __init__(self, api_key, model_name=MODEL_NAME):
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        self.genai = genai
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, prompt):
+        return self.model.generate_content(prompt)
+
+    def with_prefix(self, prefix, ttl_s=PREFIX_CACHE_TTL_S, scope=""):
+        return GeminiContextCache(self.genai, self.model_name, prefix, ttl_s, scope)
+
+
+def _model_id(name):
+    """models/gemini-2.5-flash 与 gemini-2.5-flash 视为同一模型。"""
+    return (name or "").rsplit("/", 1)[-1]
+
+
+class GeminiContextCache:
+    """Gemini 上下文缓存 (CachedContent)：固定前缀上传一次，之后的请求只发送后缀。
 
-        self.log("📋 正在读取数据...")
+    缓存命名为 lqa-<scope>-<模型指纹>-<前缀指纹>，scope 取自术语表文件路径，术语表内容或说明一改指纹就变：
+    创建时复用同名、同模型且未过期的缓存，删除同一 scope 与模型下的其余缓存 (旧版术语表)，
+    其他术语表或其他模型的缓存不受影响 (缓存绑定创建时的模型，换 --model 不能复用)。
+    剩余有效期不足 TTL 的四分之一时续期，缓存被提前清除 (404) 时重建。
+    前缀低于接口的最小缓存 token 数或模型不支持缓存时退回 system_instruction，cached 为 False。
+    """
+
+    def __init__(self, genai, model_name, prefix, ttl_s=PREFIX_CACHE_TTL_S, scope=""):
+        self.genai = genai
+        self.model_name = model_name
+        self.prefix = prefix
+        self.ttl_s = ttl_s
+        self.scope = f"lqa-{scope}-{fingerprint(model_name)[:6]}-"
+        self.name = self.scope + fingerprint(prefix)[:16]
+        self.content = None
+        self.error = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
         try:
-            df = pd.read_excel(self.input_path)
-            glossary = ""
-            if self.glossary_path:
-                glossary_df = pd.read_excel(self.glossary_path)
-                glossary = glossary_df.to_string(index=False)
-            
-            total_rows = len(df)
-            batch_size = 10
-            all_reports = []
-
-            for i in range(0, total_rows, batch_size):
-                batch = df.iloc[i : i + batch_size]
-                batch_text = "\n".join([f"{row.get('ID', 'N/A')} | {row.get('Source', '')} | {row.get('Target', '')}" for _, row in batch.iterrows()])
-                
-                self.log(f"🔍 正在审计第 {i+1} 至 {min(i+batch_size, total_rows)} 行...")
-                
-                prompt = f"你是一个游戏本地化专家。请根据术语表：\n{glossary}\n审核以下翻译：\n{batch_text}\n指出术语错误、爆框（>30字符）或语感生硬。直接输出 ID | 问题 | 建议。"
-                
-                response = model.generate_content(prompt)
-                all_reports.append(response.text)
-                
-                # 更新进度条
-                self.progress_bar.set((i + batch_size) / total_rows)
-            
-            # 保存结果
-            with open("LQA_Audit_Report.txt", "w", encoding="utf-8") as f:
-                f.write("\n".join(all_reports))
-            
-            self.log("✅ 审计完成！报告已生成为：LQA_Audit_Report.txt")
-            messagebox.showinfo("成功", "审计已完成，报告已保存！")
+            self._open()
+        except Exception as e:
+            self.error = e
+            self.model = genai.GenerativeModel(model_name, system_instruction=prefix)
+
+    @property
+    def cached(self):
+        return self.content is not None
 
+    def _open(self):
+        caching, ttl = self.genai.caching, datetime.timedelta(seconds=self.ttl_s)
+        found = None
+        for content in caching.CachedContent.list():
+            if not (content.display_name or "").startswith(self.scope):
+                continue
+            if content.display_name == self.name and found is None and _model_id(content.model) == _model_id(self.model_name):
+                found = content
+            else:
+                content.delete()
+        if found is not None:
+            found.update(ttl=ttl)
+        else:
+            found = caching.CachedContent.create(model=self.model_name, display_name=self.name,
+                                                 system_instruction=self.prefix, ttl=ttl)
+        model = self.genai.GenerativeModel.from_cached_content(cached_content=found)
+        self.model, self.content, self.expires_at = model, found, time.time() + self.ttl_s
+
+    def generate_content(self, prompt):
+        if self.content is not None and self.expires_at - time.time() < self.ttl_s / 4:
+            with self._lock:
+                if self.expires_at - time.time() < self.ttl_s / 4:
+                    self.content.update(ttl=datetime.timedelta(seconds=self.ttl_s))
+                    self.expires_at = time.time() + self.ttl_s
+        try:
+            return self.model.generate_content(prompt)
         except Exception as e:
-            self.log(f"❌ 运行报错: {str(e)}")
-            messagebox.showerror("运行错误", str(e))
+            if self.content is None or _error_status(e) != 404:
+                raise
+            with self._lock:
+                self._open()
+            return self.model.generate_content(prompt)
+
+
+class OpenAICompatModel:
+    """OpenAI 兼容的 /chat/completions 接口 (vLLM、Ollama、各类代理网关等)，仅依赖标准库。
+
+    HTTP 错误原样抛出 urllib 的 HTTPError (带 .code)，由 ModelClient 判断是否重试。
+    """
+
+    def __init__(self, base_url, api_key="", model_name=MODEL_NAME, timeout=HTTP_TIMEOUT_S, system_prompt=""):
+        self.base_url = base_url
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self.system_prompt = system_prompt
+
+    def with_prefix(self, prefix, ttl_s=None, scope=""):
+        """固定前缀作为 system 消息逐字发送：接口没有显式缓存，但 vLLM / OpenAI 等会自动复用相同前缀的计算。"""
+        return OpenAICompatModel(self.base_url, self.api_key, self.model_name, self.timeout, system_prompt=prefix)
+
+    def generate_content(self, prompt):
+        messages = [{"role": "user", "content": prompt}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        body = json.dumps({"model": self.model_name, "messages": messages, "temperature": 0}).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError:
+            raise
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"无法连接 {self.url}: {e.reason}") from e
+        return ModelResponse(payload["choices"][0]["message"].get("content") or "", payload.get("usage"))
+
+
+class MockLQAServer:
+    """本地模拟的 OpenAI 兼容服务器 (ThreadingHTTPServer)，用于离线回归测试与性能基准。
+
+    latency_ms / jitter_ms 控制每个请求的耗时，error_rate 为返回 429 的概率，shape 决定响应形态：
+        issues   每 issue_every 行报告一个问题 (标准 "ID | 问题 | 建议")
+        clean    空响应 (无问题)
+        markdown 带代码块和表头的 Markdown 表格，覆盖解析器的容错路径
+        verbose  问题前后夹带大段说明文字，模拟长响应
+    system 消息模拟服务端前缀缓存：见过的相同前缀在 usage.prompt_tokens_details.cached_tokens 中报告。
+    record_path 非空时把收到的每个请求 (messages) 逐行追加为 JSONL，便于核对实际发送的内容。
+    """
+
+    SHAPES = ["issues", "clean", "markdown", "verbose"]
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=50, jitter_ms=20, shape="issues", error_rate=0.0, issue_every=5,
+                 record_path=""):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.shape = shape
+        self.error_rate = error_rate
+        self.issue_every = max(1, issue_every)
+        self.record_path = record_path
+        self.requests = 0
+        self.received_bytes = 0
+        self._prefixes = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    messages = json.loads(self.rfile.read(length))["messages"]
+                    prompt = messages[-1]["content"]
+                    system = "".join(m["content"] for m in messages if m.get("role") == "system")
+                except (ValueError, KeyError, IndexError, TypeError):
+                    return self._reply(400, {"error": {"message": "bad request"}})
+                mock.record(messages, length)
+                status, payload = mock.respond(prompt, system)
+                self._reply(status, payload)
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, messages, size):
+        with self._lock:
+            self.received_bytes += size
+            if self.record_path:
+                with open(self.record_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"ts": round(time.time(), 3), "bytes": size, "messages": messages}, ensure_ascii=False) + "\n")
+
+    def respond(self, prompt, system=""):
+        with self._lock:
+            self.requests += 1
+            seen = fingerprint(system) in self._prefixes
+            if system:
+                self._prefixes.add(fingerprint(system))
+        delay = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return 429, {"error": {"message": "Rate limit exceeded (mock)", "code": 429}}
+        ids = _prompt_row_ids(prompt)
+        lines = [f"{row_id} | [Terminology] 术语与术语表不一致 (mock) | 请参照术语表" for row_id in ids[::self.issue_every]]
+        if self.shape == "clean":
+            text = ""
+        elif self.shape == "markdown":
+            text = "```\n| ID | 问题 | 建议 |\n|---|---|---|\n" + "\n".join(f"| {line} |" for line in lines) + "\n```"
+        elif self.shape == "verbose":
+            text = "以下是审核结果，已逐行检查术语、长度与语感：\n\n" + "\n".join(lines) + "\n\n其余行未发现明显问题。" * 5
+        else:
+            text = "\n".join(lines)
+        usage = {"prompt_tokens": estimate_tokens(system + prompt), "completion_tokens": estimate_tokens(text),
+                 "prompt_tokens_details": {"cached_tokens": estimate_tokens(system) if seen else 0}}
+        return 200, {"choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def endpoint_id(backend, base_url=""):
+    """响应缓存键中的端点标识：后端名，带 base_url 时附上去掉末尾斜杠的地址。"""
+    return f"{backend}:{base_url.rstrip('/')}" if base_url else backend
+
+
+def make_model(backend, api_key="", model_name=MODEL_NAME, base_url="", **options):
+    """按名称创建模型后端 (均提供 generate_content(prompt).text)。mock 会在本进程内启动模拟服务器。"""
+    if backend == "gemini":
+        return GeminiModel(api_key, model_name)
+    if backend == "openai":
+        if not base_url:
+            raise ValueError("openai 后端需要 --base-url")
+        return OpenAICompatModel(base_url, api_key, model_name)
+    if backend == "mock":
+        server = MockLQAServer(latency_ms=options.get("latency_ms", 50), shape=options.get("shape", "issues"),
+                               error_rate=options.get("error_rate", 0.0), record_path=options.get("record_path", "")).start()
+        return OpenAICompatModel(server.url, model_name=model_name)
+    if backend == "fake":
+        return FakeModel(options.get("fake_latency_s", 0.5), throttle_rate=options.get("throttle_rate", 0.1),
+                         spike_rate=options.get("spike_rate", 0.05), tail_alpha=options.get("tail_alpha", 0.0))
+    raise ValueError(f"未知的模型后端: {backend}")
+
+
+def response_usage(response):
+    """从响应元数据取 (输入 token, 输出 token, 命中缓存的输入 token)：Gemini 为 usage_metadata，
+    OpenAI 兼容接口为 usage。取不到的项为 None。"""
+    meta = getattr(response, "usage_metadata", None)
+    if meta is not None:
+        return (getattr(meta, "prompt_token_count", None), getattr(meta, "candidates_token_count", None),
+                getattr(meta, "cached_content_token_count", None))
+    usage = getattr(response, "usage", None) or {}
+    return (usage.get("prompt_tokens"), usage.get("completion_tokens"),
+            (usage.get("prompt_tokens_details") or {}).get("cached_tokens"))
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes // 60}:{minutes % 60:02d}:{secs:02d}" if minutes >= 60 else f"{minutes:02d}:{secs:02d}"
+
+
+class Telemetry:
+    """审计遥测：每个批次一行写入 JSONL 追踪文件，并定期刷新 Prometheus 文本格式快照。
+
+    记录排队等待、令牌桶等待、并发名额等待、请求 (含重试与退避)、解析各段耗时，响应元数据中的 token 数 (缺失时按估算值并标记)，
+    重试次数与费用估算；eta() 按已完成比例推算剩余时间。只在主进程中使用，不跨进程传递。
+    """
+
+    def __init__(self, out_base, label):
+        self.trace_path = out_base + TRACE_SUFFIX
+        self.metrics_path = out_base + METRICS_SUFFIX
+        self.label = label
+        self.started = time.time()
+        self.counters = {"batches_ok": 0, "batches_failed": 0, "rows": 0, "issues": 0, "retries": 0,
+                         "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "prefix_bytes_saved": 0, "hedges": 0, "hedge_wins": 0, "cost_usd": 0.0}
+        self.sources = {}
+        self.buckets = {name: [0] * (len(LATENCY_BUCKETS) + 1) for name in ("queue", "rate_wait", "limiter_wait", "request", "parse")}
+        self.sums = {name: 0.0 for name in self.buckets}
+        self.eta_seconds = None
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self._trace = open(self.trace_path, "a", encoding="utf-8")
+
+    def _observe(self, name, seconds):
+        i = next((k for k, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        self.buckets[name][i] += 1
+        self.sums[name] += seconds
+
+    def record(self, **event):
+        """记录一个批次。event 至少包含 rows / issues / source / queue_s / request_s / parse_s / attempts / error，
+        由模型回答的批次还有 rate_wait_s / limiter_wait_s。"""
+        with self._lock:
+            c = self.counters
+            c["batches_failed" if event.get("error") else "batches_ok"] += 1
+            c["rows"] += event.get("rows", 0)
+            c["issues"] += event.get("issues", 0)
+            c["retries"] += max(0, event.get("attempts", 0) - 1)
+            c["prompt_tokens"] += event.get("prompt_tokens") or 0
+            c["output_tokens"] += event.get("output_tokens") or 0
+            c["cached_tokens"] += event.get("cached_tokens") or 0
+            c["prefix_bytes_saved"] += event.get("prefix_saved_bytes") or 0
+            c["hedges"] += bool(event.get("hedged"))
+            c["hedge_wins"] += bool(event.get("hedge_won"))
+            if event.get("source") == "model":
+                cached = event.get("cached_tokens") or 0
+                c["cost_usd"] += (max(0, (event.get("prompt_tokens") or 0) - cached) * PRICE_INPUT_PER_M
+                                  + cached * PRICE_CACHED_PER_M + (event.get("output_tokens") or 0) * PRICE_OUTPUT_PER_M) / 1e6
+            self.sources[event.get("source", "model")] = self.sources.get(event.get("source", "model"), 0) + 1
+            for name in self.buckets:
+                self._observe(name, event.get(f"{name}_s", 0.0))
+            self._trace.write(json.dumps({"ts": round(time.time(), 3), "file": self.label, **event}, ensure_ascii=False) + "\n")
+            if time.time() - self._last_flush >= METRICS_FLUSH_S:
+                self._flush()
+
+    def eta(self, fraction):
+        """按已完成比例估算剩余秒数 (比例为 0 时返回 None)。"""
+        if fraction <= 0:
+            return None
+        elapsed = time.time() - self.started
+        self.eta_seconds = max(0.0, elapsed * (1 - fraction) / fraction)
+        return self.eta_seconds
+
+    def _flush(self):
+        self._trace.flush()
+        self._last_flush = time.time()
+        file_label = f'file="{os.path.basename(self.label)}"'
+        elapsed = max(1e-9, time.time() - self.started)
+        c = self.counters
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP lqa_{name} {help_text}")
+            lines.append(f"# TYPE lqa_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"lqa_{name}{{{','.join([file_label] + labels)}}} {value}")
+
+        metric("batches_total", "counter", "Audited batches by status",
+               [(['status="ok"'], c["batches_ok"]), (['status="failed"'], c["batches_failed"])])
+        metric("batch_source_total", "counter", "Batches answered by model, cache or journal",
+               [([f'source="{k}"'], v) for k, v in sorted(self.sources.items())])
+        metric("rows_total", "counter", "Rows covered by finished batches", [([], c["rows"])])
+        metric("issues_total", "counter", "AI issues parsed", [([], c["issues"])])
+        metric("retries_total", "counter", "Model request retries", [([], c["retries"])])
+        metric("tokens_total", "counter", "Tokens from response metadata (estimated when missing)",
+               [(['kind="prompt"'], c["prompt_tokens"]), (['kind="output"'], c["output_tokens"]),
+                (['kind="cached"'], c["cached_tokens"])])
+        metric("hedges_total", "counter", "Hedged model requests by which copy returned first",
+               [(['winner="hedge"'], c["hedge_wins"]), (['winner="primary"'], c["hedges"] - c["hedge_wins"])])
+        metric("prefix_bytes_saved_total", "counter", "Fixed prompt prefix bytes not sent because a context cache served them",
+               [([], c["prefix_bytes_saved"])])
+        metric("cost_usd_total", "counter", "Estimated model cost in USD", [([], round(c["cost_usd"], 6))])
+        metric("throughput_rows_per_second", "gauge", "Rows per second since start", [([], round(c["rows"] / elapsed, 3))])
+        metric("eta_seconds", "gauge", "Estimated seconds remaining",
+               [([], round(self.eta_seconds, 1) if self.eta_seconds is not None else "NaN")])
+        for name in self.buckets:
+            lines.append(f"# HELP lqa_{name}_seconds Batch {name} time")
+            lines.append(f"# TYPE lqa_{name}_seconds histogram")
+            cumulative = 0
+            for bound, count in zip([*LATENCY_BUCKETS, "+Inf"], self.buckets[name]):
+                cumulative += count
+                lines.append(f'lqa_{name}_seconds_bucket{{{file_label},le="{bound}"}} {cumulative}')
+            lines.append(f"lqa_{name}_seconds_sum{{{file_label}}} {round(self.sums[name], 3)}")
+            lines.append(f"lqa_{name}_seconds_count{{{file_label}}} {cumulative}")
+        tmp_path = self.metrics_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.metrics_path)  # 整体替换，抓取方不会读到半个文件
+
+    def summary(self):
+        c = self.counters
+        elapsed = max(1e-9, time.time() - self.started)
+        cached = f" (命中缓存 {c['cached_tokens']})" if c["cached_tokens"] else ""
+        return (f"📈 {c['rows'] / elapsed:.1f} 行/秒，请求 token {c['prompt_tokens']}{cached} / 输出 token {c['output_tokens']}，"
+                f"估算费用 ${c['cost_usd']:.4f}，追踪：{os.path.basename(self.trace_path)}")
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._trace.close()
+
+
+def _stamp_queue_time(batches, spec_of=lambda batch: batch):
+    """dispatch_batches 取出批次即提交，在此记下提交时刻，用于计算排队等待时间。"""
+    for batch in batches:
+        spec_of(batch).queued_at = time.perf_counter()
+        yield batch
+
+
+def load_shared_resources(settings, log=None):
+    """加载术语表索引、翻译记忆与布局表 (同一文件的多个译文列共用一份)。"""
+    glossary_index = tm_pairs = layout = None
+    if settings.glossary_path:
+        glossary_index = GlossaryIndex.from_dataframe(read_table(settings.glossary_path))
+        if log:
+            log(f"📚 术语表已建立索引：{len(glossary_index)} 条")
+    if settings.tm_path:
+        tm_pairs = load_tm_pairs(settings.tm_path)
+        if log:
+            log(f"📖 翻译记忆已加载：{len(tm_pairs)} 条")
+    if settings.layout_path:
+        layout = load_layout(settings.layout_path)
+        if log:
+            log(f"📐 布局表已加载：{len(layout)} 个 ID 的框宽")
+    return glossary_index, tm_pairs, layout
+
+
+class AuditJob:
+    """单个待审文件 (单个译文列) 的审计流程：预检 → 分批 → 发送 (缓存 / 断点日志) → 解析 → 回填导出。
+
+    GUI 中 run() 直接消费 iter_batches() 生成器，边读边发；命令行批量模式下先在子进程里
+    prepare() 解析出全部批次，主进程用共享的 ModelClient 发送，再回到子进程 finalize() 写报告。
+    log / on_progress 回调在跨进程传递前需可 pickle (或为 None)。
+    target_column 不是 "Target" 时作为多语言扇出 (MultiTargetJob) 中的一路，由外部驱动 begin / send / on_done / end。
+    """
+
+    def __init__(self, input_path, settings, out_base=None, log=None, on_progress=None, target_column="Target", target_lang=None):
+        self.input_path = input_path
+        self.settings = settings
+        self.out_base = out_base or os.path.splitext(input_path)[0]
+        self.log = log
+        self.on_progress = on_progress
+        self.target_column = target_column
+        self.target_lang = target_lang or settings.target_lang
+        self.scope = target_column  # 项目索引与断点日志按译文列区分
+        self.specs = []
+        self.prechecker = None
+        self.clusterer = None
+        self.packer = None
+        self.results = []
+        self.failed = []
+        self.failed_rows = set()  # 失败批次覆盖的行号 (重排后批次的行号不连续)
+        self.ai_issues = []
+        self.unparsed = []
+        self.issues_by_row = {}
+        self.prefix = None  # 固定前缀模式下每个请求共用的前缀
+        self.prefix_scope = fingerprint(os.path.abspath(settings.glossary_path))[:8] if settings.glossary_path else "none"
+        self.stats = {"terms": 0, "capped": 0, "rows_done": 0, "cache_hits": 0, "cache_misses": 0, "resumed": 0, "seconds": 0.0}
+
+    def _log(self, message):
+        if self.log:
+            self.log(message)
+
+    def iter_batches(self, chunks=None, glossary_index=None, tm_pairs=None, layout=None, chunk_ticks=False):
+        """生成本文件的批次。chunks 为空时自行读取；扇出时由调用方传入共享的块流与术语 / TM / 布局资源。"""
+        s = self.settings
+        if chunks is None:
+            glossary_index, tm_pairs, layout = load_shared_resources(s, self._log)
+            chunks = iter_sheet_chunks(self.input_path)
+        if self.target_column != "Target":
+            chunks = (dict(chunk, Target=chunk[self.target_column]) for chunk in chunks)
+        known_hashes = None
+        if s.project_path:
+            index = ProjectIndex(s.project_path)
+            try:
+                known_hashes = index.hashes(self.scope)
+            finally:
+                index.close()
+            self._log(f"🗂️ 增量审计：项目索引中已有上一版 {len(known_hashes)} 行")
+        width_checker = make_width_checker(s, self.target_lang, layout)
+        if width_checker:
+            self._log(f"📏 爆框按字体像素宽度检查：{os.path.basename(width_checker.metrics.font.path)} {s.font_size}px")
+        enforcer = None
+        if glossary_index and s.glossary_check:
+            enforcer = GlossaryEnforcer.for_target(glossary_index, self.target_column, self.target_lang)
+            if enforcer:
+                self._log(f"📚 术语一致性本地检查：{len(enforcer)} 条术语，{enforcer.variants} 个译法 / 词形变体")
+            else:
+                self._log(f"⚠️ 术语表中没有与 {self.target_column} 对应的译法列，跳过术语一致性本地检查")
+        self.prechecker = PreChecker(self.target_lang, tm_pairs, s.only_suspicious, self.out_base + PRECHECK_SUFFIX, known_hashes,
+                                     width_checker, enforcer)
+
+        chunks = self.prechecker.iter_chunks(chunks)
+        if s.cluster_mode != "off":
+            self.clusterer = TextClusterer(s.cluster_mode)
+            chunks = self.clusterer.iter_chunks(chunks)
+        if s.prefix_cache:
+            # 完整术语表进入固定前缀，分批时不再按批匹配术语
+            glossary = glossary_index.render(range(len(glossary_index.lines))) if glossary_index else "（无术语表）"
+            self.prefix = AUDIT_PREFIX_TEMPLATE.format(glossary=glossary)
+            glossary_index = None
+            self._log(f"🧷 固定前缀 {len(self.prefix.encode('utf-8')) / 1024:.1f} KB (说明 + 完整术语表)，各批只发送待审行")
+        if s.group_by:
+            self.packer = LocalityPacker(s.group_by, glossary_index, s.token_budget, s.min_rows, s.max_rows, s.pack_window)
+            chunks = self.packer.iter_chunks(chunks)
+        for batch in iter_row_batches(chunks, glossary_index, s.token_budget, s.min_rows, s.max_rows, chunk_ticks):
+            if batch is None:
+                yield None  # 块边界，供扇出时各语言同步推进
+                continue
+            batch_text = format_batch_rows(batch.ids, batch.sources, batch.targets)
+            glossary, term_ids, truncated = "", [], False
+            if self.prefix:
+                prompt = AUDIT_SUFFIX_TEMPLATE.format(batch_text=batch_text)
+                key = ResponseCache.make_key(s.endpoint, s.model_name, AUDIT_SUFFIX_TEMPLATE, fingerprint(self.prefix), batch_text)
+            else:
+                if glossary_index:
+                    # 只注入本批 Source 中实际出现的术语
+                    term_ids, truncated = glossary_index.select(batch.term_hits)
+                    glossary = glossary_index.render(term_ids)
+                prompt = AUDIT_PROMPT_TEMPLATE.format(glossary=glossary, batch_text=batch_text)
+                key = ResponseCache.make_key(s.endpoint, s.model_name, AUDIT_PROMPT_TEMPLATE, fingerprint(glossary), batch_text)
+            spec = BatchSpec(batch.start, batch.end, key, prompt, dict(zip(batch.ids, batch.rows)),
+                             len(batch.ids), batch.est_tokens, len(term_ids), truncated)
+            self.stats["terms"] += spec.n_terms
+            self.stats["capped"] += truncated
+            self.specs.append(spec)
+            yield spec
+        self.prechecker.tm_pairs = self.prechecker.width_checker = self.prechecker.glossary_enforcer = None  # 之后不再需要，避免跨进程传回
+        if self.packer:
+            self.packer.glossary_index = None
+
+    def prepare(self):
+        """一次性解析出全部批次 (命令行模式在子进程中调用)。"""
+        for _ in self.iter_batches():
+            pass
+        self._log(f"🧮 解析完成：{self.prechecker.rows} 行，{len(self.specs)} 个批次待发送")
+        return self
+
+    def begin(self, client, cache, total_rows=None, telemetry=None):
+        """发送前的准备：打开断点日志与遥测，记下共享的模型客户端与响应缓存。"""
+        self._client, self._cache = client, cache
+        self._journal = AuditJournal(self.input_path, self.scope)
+        self._own_telemetry = telemetry is None
+        self._telemetry = telemetry or Telemetry(self.out_base, self.input_path)
+        self._lock = threading.Lock()
+        self._total_rows = total_rows
+        self._started = time.time()
+        if self._journal.resumed:
+            self._log(f"♻️ 检测到未完成的审计，已从断点恢复 {self._journal.resumed} 批，仅补跑剩余部分")
+
+    def send(self, spec):
+        trace = spec.trace = {"queue_s": time.perf_counter() - spec.queued_at if spec.queued_at else 0.0, "source": "journal"}
+        text = self._journal.get(spec.start, spec.end, spec.key)
+        if text is not None:
+            return text
+        text = self._cache.get(spec.key)
+        with self._lock:
+            self.stats["cache_hits" if text is not None else "cache_misses"] += 1
+        trace["source"] = "cache"
+        if text is None:
+            trace["source"] = "model"
+            text = self._client.generate(spec.prompt, trace, self.prefix, self.prefix_scope)
+            self._cache.put(spec.key, text)
+        self._journal.record(spec.start, spec.end, spec.key, text)
+        return text
+
+    def on_done(self, done, idx, text, error):
+        spec = self.specs[idx]
+        self.stats["rows_done"] += spec.n_rows
+        parse_started = time.perf_counter()
+        issues = []
+        if text is not None:
+            issues, leftovers = parse_audit_response(text, spec.id_rows)
+            self.ai_issues.extend(issues)
+            if self.clusterer:
+                self.ai_issues.extend(self.clusterer.propagate(issues))
+            self.unparsed.extend(AuditIssue(0, "", line, origin="AI (未归属)") for line in leftovers)
+        trace = spec.trace or {}
+        if trace.get("source") == "model" and trace.get("prompt_tokens") is None:
+            # 响应元数据里没有 token 数时按估算值记录
+            trace.update(prompt_tokens=spec.est_tokens + (estimate_tokens(self.prefix) if self.prefix else 0),
+                         output_tokens=estimate_tokens(text or ""), tokens_estimated=True)
+        self._telemetry.record(lang=self.target_column, batch=idx, start=spec.start, end=spec.end, rows=spec.n_rows,
+                               issues=len(issues), parse_s=time.perf_counter() - parse_started,
+                               error=str(error) if error else None, **trace)
+        if error:
+            self.failed_rows.update(spec.id_rows.values())
+        spec.prompt, spec.id_rows, spec.trace = None, None, None  # 已发送并解析，释放内存
+        if error:
+            self.failed.append(idx)
+            self._log(f"⚠️ 第 {spec.start} 至 {spec.end} 行审计失败: {error}")
+        else:
+            eta = ""
+            if self._total_rows:
+                eta = f"，预计剩余 {_format_eta(self._telemetry.eta(min(1.0, self.rows_settled() / self._total_rows)))}"
+            self._log(f"🔍 已完成第 {spec.start} 至 {spec.end} 行 ({spec.n_rows} 行, ≈{spec.est_tokens} tokens, 第 {done} 批{eta})")
+        # 按已完成行数 (含预检跳过的行) 更新进度
+        if self._total_rows and self.on_progress:
+            self.on_progress(min(1.0, self.rows_settled() / self._total_rows))
+
+    def rows_settled(self):
+        """已有结论的行数：已审完的行 + 预检阶段直接跳过的行。"""
+        if self.prechecker is None:
+            return self.stats["rows_done"]
+        clustered = self.clusterer.clustered if self.clusterer else 0
+        return self.stats["rows_done"] + clustered + self.prechecker.rows - self.prechecker.sent
+
+    def end(self):
+        """发送结束：输出统计，全部成功时删除断点日志。"""
+        self.stats.update(resumed=self._journal.resumed, seconds=time.time() - self._started)
+        self._log(self.prechecker.summary())
+        if self.clusterer and self.clusterer.clustered:
+            self._log(self.clusterer.summary())
+        if self.packer:
+            self._log(self.packer.summary())
+        if self.specs:
+            tokens = [spec.est_tokens for spec in self.specs]
+            self._log(f"📦 共 {len(self.specs)} 个请求，平均每批 {self.stats['rows_done'] / len(self.specs):.1f} 行 / ≈{sum(tokens) / len(tokens):.0f} tokens，最大 ≈{max(tokens)} tokens (预算 {self.settings.token_budget})")
+            if self.settings.glossary_path:
+                self._log(f"📚 平均每批注入 {self.stats['terms'] / len(self.specs):.1f} 条术语" + (f"，{self.stats['capped']} 批超过 {GLOSSARY_MAX_TERMS} 条上限已截断" if self.stats["capped"] else ""))
+        self._log(f"💾 缓存命中 {self.stats['cache_hits']} 批 / 未命中 {self.stats['cache_misses']} 批")
+        if self._own_telemetry:
+            self._telemetry.close()
+            self._log(self._telemetry.summary())
+        if self.failed:
+            self._log(f"⚠️ {len(self.failed)} 个批次失败，已在报告中标注；重新运行将只补跑失败批次")
+        else:
+            self._journal.finish()
+        self._client = self._cache = self._journal = self._lock = self._telemetry = None  # 之后还要跨进程 finalize
+
+    def run(self, client):
+        """发送全部批次。未 prepare() 时边读边发；单个批次失败只记录，不中断整体。"""
+        batches = self.specs if self.specs else self.iter_batches()
+        total_rows = count_rows(self.input_path)
+        self._log(f"🔍 {'共 %d 行，' % total_rows if total_rows else ''}{self.settings.max_workers} 路并发审计...")
+        cache = ResponseCache()
+        try:
+            self.begin(client, cache, total_rows)
+            self.results = dispatch_batches(_stamp_queue_time(batches), self.send, self.settings.max_workers, self.on_done)
+            evicted = cache.evict()
+        finally:
+            cache.close()
+        self.end()
+        if evicted:
+            self._log(f"💾 清理过期缓存 {evicted} 条")
+        self._log(client.summary())
+        return self
+
+    def finalize(self, write_workbook=True):
+        """写出原始报告、回填工作簿和问题清单，返回本文件的汇总信息。
+
+        write_workbook=False 时不写回填工作簿，问题按行号留在 issues_by_row 中，由扇出任务合并写出。
+        """
+        report_path = self.out_base + REPORT_SUFFIX
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(
+                text if text is not None else f"❌ 第 {spec.start} 至 {spec.end} 行审计失败，请重新运行"
+                for spec, text in zip(self.specs, self.results)
+            ))
+
+        carried = self._update_project_index() if self.settings.project_path else []
+
+        # 结构化结果：回填原表 + 导出问题清单
+        issues = load_precheck_issues(self.out_base + PRECHECK_SUFFIX) + self.ai_issues + carried
+        issues.sort(key=lambda i: i.row)
+        row_cluster = self.clusterer.row_cluster if self.clusterer else {}
+        for issue in issues:
+            issue.cluster = row_cluster.get(issue.row, "")
+            self.issues_by_row.setdefault(issue.row, []).append(issue)
+        self._log(f"🧾 解析到 AI 问题 {len(self.ai_issues)} 条" + (f"，{len(self.unparsed)} 行无法归属到具体 ID (见导出清单 row=0)" if self.unparsed else ""))
+        outputs = [report_path, self.out_base + PRECHECK_SUFFIX]
+        if self.target_column == "Target":  # 扇出时遥测按文件写在 MultiTargetJob 的 out_base 下
+            outputs += [self.out_base + TRACE_SUFFIX, self.out_base + METRICS_SUFFIX]
+        flagged = len(self.issues_by_row)
+        if write_workbook:
+            merged_path = self.out_base + MERGED_SUFFIX
+            write_merged_workbook(self.input_path, {self.target_column: self.issues_by_row}, merged_path,
+                                  {self.target_column: row_cluster} if self.clusterer else None)
+            self._log(f"📊 已回填 {flagged} 行问题：{merged_path}")
+            outputs.append(merged_path)
+        exported = export_issues(issues + self.unparsed, self.out_base + ISSUES_SUFFIX)
+        self._log(f"📊 问题清单已导出：{', '.join(os.path.basename(p) for p in exported)}")
+
+        return {
+            "file": self.input_path,
+            "target": self.target_column,
+            "language": self.target_lang,
+            "rows": self.prechecker.rows,
+            "sent_rows": self.prechecker.sent,
+            "requests": len(self.specs),
+            "failed_batches": len(self.failed),
+            "cache_hits": self.stats["cache_hits"],
+            "cache_misses": self.stats["cache_misses"],
+            "resumed_batches": self.stats["resumed"],
+            "precheck": dict(self.prechecker.counts),
+            "ai_issues": len(self.ai_issues),
+            "carried_issues": len(carried),
+            "clustered_rows": self.clusterer.clustered if self.clusterer else 0,
+            "unparsed_lines": len(self.unparsed),
+            "flagged_rows": flagged,
+            "seconds": round(self.stats["seconds"], 1),
+            "outputs": outputs + exported,
+        }
+
+    def _update_project_index(self):
+        """增量审计收尾：沿用未变化行的旧问题，并把本版的行哈希与问题整体写回项目索引。
+
+        失败批次覆盖的行不写入哈希，下次运行会重新送审；上一版有、本版没有的行随之删除。
+        """
+        checker = self.prechecker
+        unchanged = {row_id: row for row_id, (row, row_hash) in checker.row_index.items()
+                     if checker.known_hashes.get(row_id) == row_hash}
+        failed_rows = set(self.failed_rows)
+        if self.clusterer and failed_rows:  # 代表行失败时，同簇成员也没有得到结论
+            failed_rows.update(row for rep_row, members in self.clusterer.members.items()
+                               if rep_row in failed_rows for row, _ in members)
+        row_hashes = {row_id: row_hash for row_id, (row, row_hash) in checker.row_index.items() if row not in failed_rows}
+        index = ProjectIndex(self.settings.project_path)
+        try:
+            carried = index.carried_issues(self.scope, unchanged)
+            index.replace(self.scope, row_hashes, [i for i in self.ai_issues + carried if i.id in row_hashes])
+        finally:
+            index.close()
+        deleted = sum(1 for row_id in checker.known_hashes if row_id not in checker.row_index)
+        self._log(f"🗂️ 增量审计：新增 {checker.changed['new']} 行、修改 {checker.changed['modified']} 行、"
+                  f"未变化 {len(unchanged)} 行 (沿用问题 {len(carried)} 条)、已删除 {deleted} 行")
+        if checker.duplicate_ids:
+            self._log(f"⚠️ {len(checker.duplicate_ids)} 个 ID 缺失或重复，这些行每次都会重新送审")
+        return carried
+
+
+def read_header(path):
+    """只读取表头 (列名列表)。"""
+    first = next(iter_sheet_chunks(path, chunk_rows=1), {})
+    return list(first.keys())
+
+
+def resolve_targets(columns, specs, default_lang="English"):
+    """把 --targets 参数解析为 [(译文列, 语言)]。
+
+    每项可写列名 (EN / German，按 LANGUAGE_CODES 或语言名推断语言)、"列名=语言"，
+    或 auto (表头中所有可识别的语言列)。
+    """
+    def language_of(column):
+        if column in TARGET_LANGUAGES:
+            return column
+        return LANGUAGE_CODES.get(column.strip().upper())
+
+    targets = []
+    for spec in specs:
+        if spec.lower() == "auto":
+            targets += [(c, language_of(c)) for c in columns if c != "Source" and language_of(c)]
+            continue
+        column, _, lang = spec.partition("=")
+        if column not in columns:
+            raise ValueError(f"表头中没有译文列 {column} (现有列：{', '.join(columns)})")
+        targets.append((column, lang or language_of(column) or default_lang))
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        raise ValueError("没有识别到任何译文列，请用 --targets 指定列名")
+    return targets
+
+
+def annotate_source_chunks(chunks, glossary_index=None):
+    """多语言共用的原文侧计算，每块只做一次：预检的原文特征 (_src_features) 与术语匹配结果 (_hits)。"""
+    for chunk in chunks:
+        n = len(next(iter(chunk.values()), []))
+        sources = [_cell(v) for v in chunk.get("Source", [""] * n)]
+        chunk = dict(chunk)
+        chunk["_src_features"] = source_features(pd.Series(sources, dtype=object))
+        if glossary_index:
+            chunk["_hits"] = [glossary_index.match(source) for source in sources]
+        yield chunk
+
+
+def _prefixed_log(log, prefix, message):
+    log(f"{prefix} {message}")
+
+
+class MultiTargetJob:
+    """一个工作簿的多个译文列 (EN / DE / FR ...) 一次审完。
+
+    表格只读取一遍，原文侧的术语匹配与预检特征在各语言间共享；每个译文列是一路 AuditJob
+    (各自的预检、分批、断点日志与报告)，各语言的请求混在一起并发发送。
+    回填工作簿只写一份，每种语言各占一组问题列。接口与 AuditJob 一致 (prepare / run / finalize)。
+    """
+
+    def __init__(self, input_path, settings, out_base=None, log=None, on_progress=None):
+        self.input_path = input_path
+        self.settings = settings
+        self.out_base = out_base or os.path.splitext(input_path)[0]
+        self.log = log
+        self.on_progress = on_progress
+        self.lanes = []
+        self.order = []  # 全局批次序号 → (语言序号, 该语言内的批次序号)
+
+    def _log(self, message):
+        if self.log:
+            self.log(message)
+
+    def _make_lanes(self):
+        targets = resolve_targets(read_header(self.input_path), self.settings.targets, self.settings.target_lang)
+        self._log(f"🌐 共 {len(targets)} 个译文列：" + "、".join(f"{c} ({lang})" for c, lang in targets))
+        self.lanes = [
+            AuditJob(self.input_path, self.settings, f"{self.out_base}_{column}",
+                     partial(_prefixed_log, self.log, f"[{column}]") if self.log else None,
+                     target_column=column, target_lang=lang)
+            for column, lang in targets
+        ]
+
+    def iter_batches(self):
+        """各语言按块同步推进：每轮让每种语言处理完同一个块，tee 缓冲始终只有一两个块。"""
+        if not self.lanes:
+            self._make_lanes()
+        glossary_index, tm_pairs, layout = load_shared_resources(self.settings, self._log)
+        # 固定前缀模式下术语表整体进入前缀，无需逐行匹配
+        streams = itertools.tee(annotate_source_chunks(iter_sheet_chunks(self.input_path),
+                                                       None if self.settings.prefix_cache else glossary_index), len(self.lanes))
+        generators = [lane.iter_batches(stream, glossary_index, tm_pairs, layout, chunk_ticks=True)
+                      for lane, stream in zip(self.lanes, streams)]
+        active = list(range(len(self.lanes)))
+        while active:
+            for lane_no in list(active):
+                for spec in generators[lane_no]:
+                    if spec is None:
+                        break
+                    self.order.append((lane_no, len(self.lanes[lane_no].specs) - 1))
+                    yield self.lanes[lane_no], spec
+                else:
+                    active.remove(lane_no)
+
+    def prepare(self):
+        for _ in self.iter_batches():
+            pass
+        self._log(f"🧮 解析完成：{self.lanes[0].prechecker.rows} 行 × {len(self.lanes)} 种语言，{len(self.order)} 个批次待发送")
+        return self
+
+    def run(self, client):
+        if self.order:
+            batches = [(self.lanes[lane_no], self.lanes[lane_no].specs[idx]) for lane_no, idx in self.order]
+        else:
+            batches = self.iter_batches()
+        total_rows = count_rows(self.input_path)
+        self._log(f"🔍 {'共 %d 行，' % total_rows if total_rows else ''}多语言扇出，{self.settings.max_workers} 路并发审计...")
+
+        def on_done(done, idx, text, error):
+            lane_no, local_idx = self.order[idx]
+            self.lanes[lane_no].on_done(done, local_idx, text, error)
+            if total_rows:
+                fraction = min(1.0, sum(lane.rows_settled() for lane in self.lanes) / (total_rows * len(self.lanes)))
+                eta = telemetry.eta(fraction)
+                if done % ETA_LOG_EVERY == 0:
+                    self._log(f"⏱️ 已完成 {fraction:.0%}，预计剩余 {_format_eta(eta)}")
+                if self.on_progress:
+                    self.on_progress(fraction)
+
+        cache = ResponseCache()
+        telemetry = Telemetry(self.out_base, self.input_path)
+        try:
+            if not self.lanes:
+                self._make_lanes()
+            for lane in self.lanes:
+                lane.begin(client, cache, telemetry=telemetry)
+            results = dispatch_batches(_stamp_queue_time(batches, lambda item: item[1]), lambda item: item[0].send(item[1]),
+                                       self.settings.max_workers, on_done)
+            evicted = cache.evict()
+        finally:
+            cache.close()
+            telemetry.close()
+        for lane in self.lanes:
+            lane.results = [None] * len(lane.specs)
+        for (lane_no, local_idx), text in zip(self.order, results):
+            self.lanes[lane_no].results[local_idx] = text
+        for lane in self.lanes:
+            lane.end()
+        self._log(telemetry.summary())
+        if evicted:
+            self._log(f"💾 清理过期缓存 {evicted} 条")
+        self._log(client.summary())
+        return self
+
+    def finalize(self):
+        languages = {lane.target_column: lane.finalize(write_workbook=False) for lane in self.lanes}
+        merged_path = self.out_base + MERGED_SUFFIX
+        clusters = {lane.target_column: lane.clusterer.row_cluster for lane in self.lanes if lane.clusterer}
+        flagged = write_merged_workbook(self.input_path, {lane.target_column: lane.issues_by_row for lane in self.lanes}, merged_path,
+                                        clusters or None)
+        self._log(f"📊 已回填 {flagged} 行问题 ({len(self.lanes)} 种语言)：{merged_path}")
+        totals = {key: sum(s[key] for s in languages.values())
+                  for key in ("sent_rows", "requests", "failed_batches", "cache_hits", "cache_misses",
+                              "resumed_batches", "ai_issues", "carried_issues", "clustered_rows", "unparsed_lines")}
+        return {
+            "file": self.input_path,
+            "rows": self.lanes[0].prechecker.rows,
+            **totals,
+            "flagged_rows": flagged,
+            "seconds": max(s["seconds"] for s in languages.values()),
+            "outputs": [merged_path, self.out_base + TRACE_SUFFIX, self.out_base + METRICS_SUFFIX]
+                       + [p for s in languages.values() for p in s["outputs"]],
+            "languages": languages,
+        }
+
+
+def make_job(input_path, settings, out_base=None, log=None, on_progress=None):
+    """settings.targets 非空时按多语言扇出审计，否则审计单个 Target 列。"""
+    job_class = MultiTargetJob if settings.targets else AuditJob
+    return job_class(input_path, settings, out_base, log=log, on_progress=on_progress)
+
+
+def _prepare_job(job):
+    return job.prepare()
+
+
+def _finalize_job(job):
+    return job.finalize()
+
+
+def collect_input_files(inputs):
+    """展开命令行参数中的文件与目录 (目录只取第一层的表格文件，跳过本工具的输出)。"""
+    exts = (".xlsx", ".xlsm", ".xls", ".csv", ".parquet")
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                stem = os.path.splitext(name)[0]
+                if name.lower().endswith(exts) and not name.startswith("~$") and "_LQA" not in stem:
+                    files.append(os.path.join(item, name))
+        elif os.path.isfile(item):
+            files.append(item)
+        else:
+            print(f"⚠️ 跳过不存在的路径: {item}")
+    return files
+
+
+def audit_files(files, settings, client, procs=2, out_dir="", log=print):
+    """批量审计多个文件：表格解析 / 报告写出在进程池中进行，模型请求共享同一个 client 的并发预算。
+
+    三个阶段流水线推进 (解析 → 发送 → 写出)，某个文件出错只记录在汇总中，不影响其他文件。
+    """
+    summaries = {}
+    stage = {}
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max(1, procs)) as proc_pool, \
+            ThreadPoolExecutor(max_workers=max(1, settings.max_workers)) as runners:
+        for path in files:
+            name = os.path.basename(path)
+            out_base = os.path.join(out_dir, os.path.splitext(name)[0]) if out_dir else None
+            job = make_job(path, settings, out_base, log=partial(print, f"[{name}]") if log else None)
+            stage[proc_pool.submit(_prepare_job, job)] = ("解析", path)
+
+        while stage:
+            finished, _ = wait(stage, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step, path = stage.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    summaries[path] = {"file": path, "error": f"{step}失败: {e}"}
+                    if log:
+                        log(f"❌ {os.path.basename(path)} {step}失败: {e}")
+                    continue
+                if step == "解析":
+                    stage[runners.submit(value.run, client)] = ("审计", path)
+                elif step == "审计":
+                    stage[proc_pool.submit(_finalize_job, value)] = ("写出", path)
+                else:
+                    summaries[path] = value
+    return [summaries[path] for path in files]
+
+
+def make_synthetic_sheet(path, rows, seed=0):
+    """生成基准测试用的合成表格 (ID / Source / Target)，部分行带占位符缺失、超长等问题。"""
+    rng = random.Random(seed)
+    words = ["火焰", "之剑", "勇者", "背包", "任务", "奖励", "商店", "金币", "技能", "队伍"]
+    targets = ["Flame Sword", "Hero", "Bag", "Quest", "Reward", "Shop", "Gold", "Skill", "Party"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ID", "Source", "Target"])
+        for i in range(rows):
+            source = "".join(rng.choices(words, k=rng.randint(1, 6)))
+            target = " ".join(rng.choices(targets, k=rng.randint(1, 4)))
+            roll = rng.random()
+            if roll < 0.05:
+                source += "{0}"  # 占位符缺失
+            elif roll < 0.10:
+                target += " of the Ancient Kingdom and Beyond"  # 爆框
+            writer.writerow([f"TXT_{i:06d}", source, target])
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb():
+    """本进程及其已结束子进程中的最大常驻内存 (MB)；无 resource 模块时返回 None。"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # macOS 单位为字节，Linux 为 KB
+
+
+def _bench_one(path, base_url, workers, work_dir):
+    """在独立进程中审计一个合成表格 (基准测试)，返回吞吐、批次延迟与峰值内存。"""
+    os.chdir(work_dir)  # 响应缓存落在临时目录，确保每次都真实请求
+    client = ModelClient(OpenAICompatModel(base_url), workers, rpm=0, tpm=0)
+    started = time.perf_counter()
+    summary = audit_files([path], AuditSettings(max_workers=workers, endpoint="bench"), client, procs=1, out_dir=work_dir, log=None)[0]
+    seconds = time.perf_counter() - started
+    if "error" in summary:
+        raise RuntimeError(summary["error"])
+    return {
+        "rows": summary["rows"],
+        "requests": summary["requests"],
+        "seconds": round(seconds, 2),
+        "rows_per_s": round(summary["rows"] / seconds, 1),
+        "p50_ms": round(_percentile(client.latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(client.latencies, 95) * 1000, 1),
+        "peak_rss_mb": _peak_rss_mb(),
+        "failed_batches": summary["failed_batches"],
+    }
+
+
+def run_benchmark(sizes=BENCH_SIZES, workers=DEFAULT_WORKERS, latency_ms=50, shape="issues", out_path=BENCH_FILE):
+    """离线基准：本地模拟服务器 + 合成表格，逐个规模在新进程中跑完整流程 (峰值内存互不干扰)。"""
+    server = MockLQAServer(latency_ms=latency_ms, shape=shape).start()
+    print(f"🧪 模拟服务器 {server.url}，延迟 {latency_ms}ms，响应形态 {shape}，{workers} 路并发")
+    results = []
+    try:
+        for rows in sizes:
+            with tempfile.TemporaryDirectory(prefix="lqa_bench_") as work_dir:
+                path = os.path.join(work_dir, f"bench_{rows}.csv")
+                make_synthetic_sheet(path, rows)
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    result = pool.submit(_bench_one, path, server.url, workers, work_dir).result()
+            results.append(result)
+            rss = f"{result['peak_rss_mb']} MB" if result["peak_rss_mb"] is not None else "n/a"
+            print(f"📈 {rows:>7} 行：{result['rows_per_s']:>8} 行/秒，{result['requests']} 个请求，"
+                  f"批次延迟 p50 {result['p50_ms']}ms / p95 {result['p95_ms']}ms，峰值内存 {rss}，耗时 {result['seconds']}s")
+    finally:
+        server.stop()
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"finished_at": time.strftime("%Y-%m-%d %H:%M:%S"), "workers": workers, "latency_ms": latency_ms,
+                   "shape": shape, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"✅ 基准结果已写入：{out_path}")
+    return results
+
+
+def run_cli(argv):
+    parser = argparse.ArgumentParser(prog="lqa_tool.py", description="LQA Master 命令行批量审计 (不启动界面)")
+    parser.add_argument("inputs", nargs="*", help="待审文件或目录 (目录下的 xlsx/xls/csv/parquet 全部审计)")
+    parser.add_argument("--api-key", default="",
+                        help="API Key，默认读取环境变量 GEMINI_API_KEY / GOOGLE_API_KEY (openai 后端为 OPENAI_API_KEY)")
+    parser.add_argument("--backend", default="gemini", choices=BACKENDS, help="模型后端")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL", ""), help="openai 后端的接口地址，如 http://localhost:8000/v1")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="所有文件共享的模型并发请求上限")
+    parser.add_argument("--rpm", type=int, default=RPM_LIMIT, help="每分钟请求数上限 (0 为不限)")
+    parser.add_argument("--tpm", type=int, default=TPM_LIMIT, help="每分钟 token 上限 (0 为不限)")
+    parser.add_argument("--fake-429", type=float, default=0.1, help="fake 后端返回 429 的概率")
+    parser.add_argument("--fake-spike", type=float, default=0.05, help="fake 后端出现延迟尖刺的概率")
+    parser.add_argument("--fake-latency", type=float, default=0.5, help="fake 后端的典型单请求延迟 (秒)")
+    parser.add_argument("--fake-tail", type=float, default=0.0, metavar="ALPHA",
+                        help="fake 后端改用 Pareto(ALPHA) 重尾延迟 (如 1.2)，用于演练 --hedge")
+    parser.add_argument("--hedge", action="store_true", help="请求超过近期 P95 耗时仍未返回时发出对冲请求，取先返回者")
+    parser.add_argument("--hedge-budget", type=float, default=HEDGE_BUDGET, help="对冲请求占请求总数的上限")
+    parser.add_argument("--mock-latency", type=int, default=50, help="mock 后端 / 基准测试的单请求延迟 (毫秒)")
+    parser.add_argument("--mock-shape", default="issues", choices=MockLQAServer.SHAPES, help="mock 后端的响应形态")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="mock 后端返回 429 的概率")
+    parser.add_argument("--mock-record", default="", metavar="JSONL", help="mock 后端 / 模拟服务器把收到的请求逐行记录到此文件")
+    parser.add_argument("--serve-mock", type=int, metavar="PORT", help="只启动本地模拟服务器 (OpenAI 兼容)，供其他工具联调")
+    parser.add_argument("--bench", action="store_true", help="离线基准测试：模拟服务器 + 合成表格，输出吞吐 / 延迟 / 峰值内存")
+    parser.add_argument("--bench-sizes", type=int, nargs="+", default=BENCH_SIZES, help="基准测试的合成表格行数")
+    parser.add_argument("--procs", type=int, default=min(4, os.cpu_count() or 1), help="解析表格 / 写报告的进程数")
+    parser.add_argument("--glossary", default="", help="术语表文件")
+    parser.add_argument("--no-glossary-check", action="store_true", help="不在本地按术语表检查译法 (只交给模型)")
+    parser.add_argument("--tm", default="", help="翻译记忆文件 (精确匹配的行不送审)")
+    parser.add_argument("--lang", default="English", choices=TARGET_LANGUAGES, help="目标语言 (影响漏翻预检)")
+    parser.add_argument("--targets", nargs="+", default=[], metavar="COL[=LANG]",
+                        help="一次审计多个译文列，如 EN DE FR 或 JP=Japanese；auto 为自动识别表头中的语言列")
+    parser.add_argument("--only-suspicious", action="store_true", help="仅送审预检可疑行")
+    parser.add_argument("--cluster", default=CLUSTER_MODE, choices=TextClusterer.MODES,
+                        help="重复 / 相似文本只审一次：exact 完全相同，template 仅数字不同，near 再加 MinHash 近似匹配")
+    parser.add_argument("--font", action="append", default=[], metavar="[LANG=]PATH",
+                        help="游戏字体 (TTF/OTF)，用于像素宽度爆框检查；可重复，如 --font UI.ttf --font Japanese=NotoSansJP.otf")
+    parser.add_argument("--font-size", type=int, default=FONT_SIZE, help="字号 (px)")
+    parser.add_argument("--layout", default="", help="布局表 (ID + Width 列，可选 FontSize 列)")
+    parser.add_argument("--max-width", type=int, default=0, help="布局表中没有的 ID 使用的默认框宽 (px)")
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="说明 + 完整术语表作为固定前缀 (Gemini 上下文缓存 / system 消息)，各批只发送待审行")
+    parser.add_argument("--prefix-ttl", type=int, default=PREFIX_CACHE_TTL_S, help="上下文缓存有效期 (秒)")
+    parser.add_argument("--group-by", default="", metavar="prefix|context|COLUMN",
+                        help="分批前把同一 ID 前缀 / Context / 指定列 (如 Screen) 的行排到一起，并报告与原顺序相比的 token 与请求数")
+    parser.add_argument("--pack-window", type=int, default=PACK_WINDOW_ROWS,
+                        help="--group-by 每攒够多少待送审行重排一次；越大分组越完整，首批请求发出越晚")
+    parser.add_argument("--token-budget", type=int, default=TOKEN_BUDGET)
+    parser.add_argument("--min-rows", type=int, default=MIN_BATCH_ROWS)
+    parser.add_argument("--max-rows", type=int, default=MAX_BATCH_ROWS)
+    parser.add_argument("--out", default="", help="报告输出目录 (默认与输入文件同目录)")
+    parser.add_argument("--project", default="", help="增量审计的项目索引文件 (sqlite)，只送审相对上一版新增 / 修改的行")
+    args = parser.parse_args(argv)
+
+    if args.serve_mock is not None:
+        server = MockLQAServer(port=args.serve_mock, latency_ms=args.mock_latency, shape=args.mock_shape,
+                               error_rate=args.mock_error_rate, record_path=args.mock_record)
+        print(f"🧪 模拟服务器已启动：{server.url} (Ctrl+C 退出)")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.httpd.server_close()
+        return 0
+    if args.bench:
+        run_benchmark(args.bench_sizes, args.workers, args.mock_latency, args.mock_shape,
+                      os.path.join(args.out, BENCH_FILE) if args.out else BENCH_FILE)
+        return 0
+
+    if not args.inputs:
+        parser.error("请指定待审文件或目录")
+    if not args.api_key:
+        env_names = ["OPENAI_API_KEY"] if args.backend == "openai" else ["GEMINI_API_KEY", "GOOGLE_API_KEY"]
+        args.api_key = next((os.environ[n] for n in env_names if os.environ.get(n)), "")
+    if args.backend == "gemini" and not args.api_key:
+        parser.error("缺少 API Key：请使用 --api-key 或设置环境变量 GEMINI_API_KEY")
+    if args.backend == "openai" and not args.base_url:
+        parser.error("openai 后端需要 --base-url (或环境变量 OPENAI_BASE_URL)")
+    files = collect_input_files(args.inputs)
+    if not files:
+        parser.error("没有找到可审计的文件")
+    if args.project and len(files) > 1:
+        parser.error("--project 每次只能对应一个待审文件 (同一项目的新版本)")
+
+    settings = AuditSettings(model_name=args.model, endpoint=endpoint_id(args.backend, args.base_url),
+                             max_workers=args.workers, target_lang=args.lang,
+                             only_suspicious=args.only_suspicious, glossary_path=args.glossary, tm_path=args.tm,
+                             token_budget=args.token_budget, min_rows=args.min_rows, max_rows=args.max_rows,
+                             project_path=args.project, targets=args.targets,
+                             fonts=parse_font_args(args.font),
+                             font_size=args.font_size, layout_path=args.layout, max_width=args.max_width,
+                             cluster_mode=args.cluster, prefix_cache=args.prefix_cache,
+                             glossary_check=not args.no_glossary_check, group_by=args.group_by,
+                             pack_window=max(1, args.pack_window))
+    model = make_model(args.backend, args.api_key, args.model, args.base_url,
+                       throttle_rate=args.fake_429, spike_rate=args.fake_spike, fake_latency_s=args.fake_latency, tail_alpha=args.fake_tail,
+                       latency_ms=args.mock_latency, shape=args.mock_shape, error_rate=args.mock_error_rate,
+                       record_path=args.mock_record)
+    client = ModelClient(model, args.workers, args.rpm, args.tpm, hedge_budget=args.hedge_budget if args.hedge else 0.0)
+    client.prefix_ttl_s = args.prefix_ttl
+
+    started = time.time()
+    print(f"🚀 共 {len(files)} 个文件，{args.procs} 个解析进程，全局 {args.workers} 路并发请求 ({args.backend})")
+    summaries = audit_files(files, settings, client, args.procs, args.out)
+
+    ok = [s for s in summaries if "error" not in s]
+    summary = {
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "seconds": round(time.time() - started, 1),
+        "files": summaries,
+        "totals": {
+            "files": len(summaries),
+            "failed_files": len(summaries) - len(ok),
+            "rows": sum(s["rows"] for s in ok),
+            "sent_rows": sum(s["sent_rows"] for s in ok),
+            "requests": sum(s["requests"] for s in ok),
+            "failed_batches": sum(s["failed_batches"] for s in ok),
+            "ai_issues": sum(s["ai_issues"] for s in ok),
+            "flagged_rows": sum(s["flagged_rows"] for s in ok),
+        },
+    }
+    summary_path = os.path.join(args.out, SUMMARY_FILE) if args.out else SUMMARY_FILE
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(client.summary())
+    print(f"✅ 全部完成，汇总已写入：{summary_path}")
+    return 0 if len(ok) == len(summaries) and not summary["totals"]["failed_batches"] else 1
+
+
+# ==============================================================================
+# 🖥️ 图形界面 (仅在无命令行参数启动时加载 Tk / customtkinter)
+# ==============================================================================
+
+def run_gui():
+    from tkinter import filedialog, messagebox
+    import customtkinter as ctk  # 更好的 UI 库
+
+    # 设置 UI 风格
+    ctk.set_appearance_mode("System")
+    ctk.set_default_color_theme("blue")
+
+    class LQAToolApp(ctk.CTk):
+        def __init__(self):
+            super().__init__()
+
+            self.title("Game Localization LQA Master - AI 自动化审计工具")
+            self.geometry("800x700")
+
+            # --- UI 布局 ---
+            self.grid_columnconfigure(1, weight=1)
+
+            # 1. API 配置
+            self.api_label = ctk.CTkLabel(self, text="Gemini API Key:")
+            self.api_label.grid(row=0, column=0, padx=20, pady=10, sticky="w")
+            self.api_entry = ctk.CTkEntry(self, placeholder_text="在此输入你的 API Key...", width=400)
+            self.api_entry.grid(row=0, column=1, padx=20, pady=10, sticky="ew")
+
+            # 2. 文件选择
+            self.file_btn = ctk.CTkButton(self, text="选择待审 Excel", command=self.select_file)
+            self.file_btn.grid(row=1, column=0, padx=20, pady=10)
+            self.file_label = ctk.CTkLabel(self, text="未选择文件", text_color="gray")
+            self.file_label.grid(row=1, column=1, padx=20, pady=10, sticky="w")
+
+            self.glossary_btn = ctk.CTkButton(self, text="选择术语表 (可选)", command=self.select_glossary)
+            self.glossary_btn.grid(row=2, column=0, padx=20, pady=10)
+            self.glossary_label = ctk.CTkLabel(self, text="未选择术语表", text_color="gray")
+            self.glossary_label.grid(row=2, column=1, padx=20, pady=10, sticky="w")
+
+            self.tm_btn = ctk.CTkButton(self, text="选择 TM (可选)", command=self.select_tm)
+            self.tm_btn.grid(row=3, column=0, padx=20, pady=10)
+            self.tm_label = ctk.CTkLabel(self, text="未选择翻译记忆 (TM 精确匹配的行不送审)", text_color="gray")
+            self.tm_label.grid(row=3, column=1, padx=20, pady=10, sticky="w")
+
+            self.font_btn = ctk.CTkButton(self, text="选择字体 (可选)", command=self.select_font)
+            self.font_btn.grid(row=4, column=0, padx=20, pady=10)
+            self.font_label = ctk.CTkLabel(self, text="未选择字体 (按 30 字符估算爆框)", text_color="gray")
+            self.font_label.grid(row=4, column=1, padx=20, pady=10, sticky="w")
+
+            self.layout_btn = ctk.CTkButton(self, text="选择布局表 (可选)", command=self.select_layout)
+            self.layout_btn.grid(row=5, column=0, padx=20, pady=10)
+            self.layout_frame = ctk.CTkFrame(self, fg_color="transparent")
+            self.layout_frame.grid(row=5, column=1, padx=20, pady=10, sticky="w")
+            self.layout_label = ctk.CTkLabel(self.layout_frame, text="未选择布局表 (ID → 框宽 px)", text_color="gray")
+            self.layout_label.pack(side="left")
+            ctk.CTkLabel(self.layout_frame, text="默认框宽 px:").pack(side="left", padx=(20, 5))
+            self.max_width_entry = ctk.CTkEntry(self.layout_frame, width=60)
+            self.max_width_entry.pack(side="left")
+
+            # 3. 审计选项
+            self.options_frame = ctk.CTkFrame(self, fg_color="transparent")
+            self.options_frame.grid(row=6, column=0, columnspan=2, padx=20, pady=10, sticky="ew")
+            ctk.CTkLabel(self.options_frame, text="并发请求数:").pack(side="left")
+            self.workers_entry = ctk.CTkEntry(self.options_frame, width=60)
+            self.workers_entry.insert(0, str(DEFAULT_WORKERS))
+            self.workers_entry.pack(side="left", padx=(5, 20))
+            ctk.CTkLabel(self.options_frame, text="目标语言:").pack(side="left")
+            self.lang_combo = ctk.CTkComboBox(self.options_frame, values=TARGET_LANGUAGES, width=130, state="readonly")
+            self.lang_combo.set("English")
+            self.lang_combo.pack(side="left", padx=(5, 20))
+            self.var_only_suspicious = ctk.BooleanVar(value=False)
+            ctk.CTkCheckBox(self.options_frame, text="仅送审预检可疑行", variable=self.var_only_suspicious).pack(side="left")
+            self.var_incremental = ctk.BooleanVar(value=False)
+            ctk.CTkCheckBox(self.options_frame, text="增量审计", variable=self.var_incremental).pack(side="left", padx=(10, 0))
+            self.var_near_dup = ctk.BooleanVar(value=False)
+            ctk.CTkCheckBox(self.options_frame, text="相似文本只审一次", variable=self.var_near_dup).pack(side="left", padx=(10, 0))
+            self.var_prefix_cache = ctk.BooleanVar(value=False)
+            ctk.CTkCheckBox(self.options_frame, text="术语表前缀缓存", variable=self.var_prefix_cache).pack(side="left", padx=(10, 0))
+            self.targets_entry = ctk.CTkEntry(self.options_frame, width=140, placeholder_text="多语言列: EN,DE / auto")
+            self.targets_entry.pack(side="left", padx=(10, 0))
+
+            # 4. 运行控制
+            self.run_btn = ctk.CTkButton(self, text="🚀 开始自动化审计", command=self.start_audit_thread, fg_color="#2ECC71", hover_color="#27AE60")
+            self.run_btn.grid(row=7, column=0, columnspan=2, padx=20, pady=20, sticky="ew")
+
+            # 5. 日志输出
+            self.log_output = ctk.CTkTextbox(self, height=300)
+            self.log_output.grid(row=8, column=0, columnspan=2, padx=20, pady=10, sticky="nsew")
+
+            # 6. 进度条
+            self.progress_bar = ctk.CTkProgressBar(self)
+            self.progress_bar.grid(row=9, column=0, columnspan=2, padx=20, pady=10, sticky="ew")
+            self.progress_bar.set(0)
+
+            # 内部变量
+            self.input_path = ""
+            self.glossary_path = ""
+            self.tm_path = ""
+            self.font_path = ""
+            self.layout_path = ""
+
+        def select_file(self):
+            self.input_path = filedialog.askopenfilename(filetypes=INPUT_FILETYPES)
+            if self.input_path:
+                self.file_label.configure(text=os.path.basename(self.input_path), text_color="white")
+
+        def select_glossary(self):
+            self.glossary_path = filedialog.askopenfilename(filetypes=INPUT_FILETYPES)
+            if self.glossary_path:
+                self.glossary_label.configure(text=os.path.basename(self.glossary_path), text_color="white")
+
+        def select_tm(self):
+            self.tm_path = filedialog.askopenfilename(filetypes=INPUT_FILETYPES)
+            if self.tm_path:
+                self.tm_label.configure(text=os.path.basename(self.tm_path), text_color="white")
+
+        def select_font(self):
+            self.font_path = filedialog.askopenfilename(filetypes=[("字体文件", "*.ttf *.otf *.ttc")])
+            if self.font_path:
+                self.font_label.configure(text=os.path.basename(self.font_path), text_color="white")
+
+        def select_layout(self):
+            self.layout_path = filedialog.askopenfilename(filetypes=INPUT_FILETYPES)
+            if self.layout_path:
+                self.layout_label.configure(text=os.path.basename(self.layout_path), text_color="white")
+
+        def log(self, message):
+            self.log_output.insert("end", f"{message}\n")
+            self.log_output.see("end")
+
+        def start_audit_thread(self):
+            # 验证输入
+            if not self.api_entry.get():
+                messagebox.showerror("错误", "请输入 API Key")
+                return
+            if not self.input_path:
+                messagebox.showerror("错误", "请选择待审计的 Excel 文件")
+                return
+
+            # 开启新线程防止界面卡死
+            threading.Thread(target=self.run_audit, daemon=True).start()
+
+        def run_audit(self):
+            try: max_workers = int(self.workers_entry.get())
+            except ValueError: max_workers = DEFAULT_WORKERS
+            settings = AuditSettings(max_workers=max_workers, target_lang=self.lang_combo.get(),
+                                     only_suspicious=self.var_only_suspicious.get(),
+                                     glossary_path=self.glossary_path, tm_path=self.tm_path)
+            settings.cluster_mode = "near" if self.var_near_dup.get() else CLUSTER_MODE
+            settings.prefix_cache = self.var_prefix_cache.get()
+            settings.fonts = {"": self.font_path} if self.font_path else {}
+            settings.layout_path = self.layout_path
+            try: settings.max_width = int(self.max_width_entry.get() or 0)
+            except ValueError: settings.max_width = 0
+            settings.targets = [t.strip() for t in self.targets_entry.get().replace("，", ",").split(",") if t.strip()]
+            if self.var_incremental.get():
+                settings.project_path = os.path.splitext(os.path.abspath(self.input_path))[0] + PROJECT_INDEX_SUFFIX
+
+            self.log("📋 正在读取数据...")
+            try:
+                client = ModelClient.gemini(self.api_entry.get(), settings.model_name, max_workers)
+                job = make_job(self.input_path, settings, log=self.log, on_progress=self.progress_bar.set)
+                summary = job.run(client).finalize()
+
+                self.progress_bar.set(1)
+                self.log(f"✅ 审计完成！报告已生成为：{summary['outputs'][0]}")
+                messagebox.showinfo("成功", "审计已完成，报告已保存！")
+
+            except Exception as e:
+                self.log(f"❌ 运行报错: {str(e)}")
+                messagebox.showerror("运行错误", str(e))
 
-if __name__ == "__main__":
     app = LQAToolApp()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_cli(argv)
+    run_gui()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""测试直接 import lqa_tool (单文件工具，不是安装包)；命令行测试共用的表格与运行夹具。"""
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+TOOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOOL_DIR)
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    """在 tmp_path 写一张 ID / Source / Target 待审表，每行原文与译文不同，返回文件名。"""
+    def write(rows=60, name="t.csv"):
+        with open(tmp_path / name, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["ID", "Source", "Target"])
+            for i in range(rows):
+                writer.writerow([f"ui_{i}", f"获得{i}个宝箱奖励", f"Get {i} chest rewards now"])
+        return name
+    return write
+
+
+@pytest.fixture
+def run_cli(tmp_path):
+    """在 tmp_path 中运行 lqa_tool.py，返回 LQA_Summary.json 中第一个文件的统计 (summary=False 时不读取)。"""
+    def run(*args, summary=True):
+        subprocess.run([sys.executable, os.path.join(TOOL_DIR, "lqa_tool.py"), *args], cwd=tmp_path, check=True,
+                       capture_output=True, timeout=300)
+        if not summary:
+            return None
+        with open(tmp_path / "LQA_Summary.json", encoding="utf-8") as f:
+            return json.load(f)["files"][0]
+    return run
+
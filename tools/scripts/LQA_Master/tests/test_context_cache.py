@@ -0,0 +1,60 @@
+"""Gemini 上下文缓存：换模型不复用旧缓存；建模型失败时退回 system_instruction 且不算缓存命中。"""
+import types
+
+import lqa_tool
+
+
+class FakeContent:
+    def __init__(self, store, model, display_name):
+        self.store, self.model, self.display_name = store, f"models/{model}", display_name
+        store.append(self)
+
+    def update(self, ttl):
+        pass
+
+    def delete(self):
+        self.store.remove(self)
+
+
+def fake_genai(fail_from_cache=False):
+    store = []
+
+    class CachedContent:
+        @staticmethod
+        def list():
+            return list(store)
+
+        @staticmethod
+        def create(model, display_name, system_instruction, ttl):
+            return FakeContent(store, model, display_name)
+
+    class GenerativeModel:
+        def __init__(self, model_name, system_instruction=None):
+            self.model_name, self.system_instruction = model_name, system_instruction
+
+        @classmethod
+        def from_cached_content(cls, cached_content):
+            if fail_from_cache:
+                raise RuntimeError("model does not support caching")
+            return cls(cached_content.model)
+
+    return types.SimpleNamespace(caching=types.SimpleNamespace(CachedContent=CachedContent),
+                                 GenerativeModel=GenerativeModel), store
+
+
+def test_other_model_gets_its_own_cache():
+    genai, store = fake_genai()
+    first = lqa_tool.GeminiContextCache(genai, "gemini-2.5-flash", "prefix", scope="g")
+    second = lqa_tool.GeminiContextCache(genai, "gemini-2.5-pro", "prefix", scope="g")
+    assert first.cached and second.cached
+    assert second.model.model_name == "models/gemini-2.5-pro"
+    assert sorted(c.model for c in store) == ["models/gemini-2.5-flash", "models/gemini-2.5-pro"]
+    again = lqa_tool.GeminiContextCache(genai, "gemini-2.5-flash", "prefix", scope="g")
+    assert again.content is first.content
+
+
+def test_fallback_is_not_counted_as_cached():
+    genai, _ = fake_genai(fail_from_cache=True)
+    cache = lqa_tool.GeminiContextCache(genai, "gemini-2.5-flash", "prefix", scope="g")
+    assert not cache.cached
+    assert cache.model.system_instruction == "prefix"
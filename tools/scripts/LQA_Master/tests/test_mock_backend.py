@@ -0,0 +1,21 @@
+"""mock 后端 (本地模拟的 OpenAI 兼容服务器) 的各种响应形态都能被解析，基准测试输出吞吐与延迟。"""
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize("shape, issues, unparsed", [("issues", 12, 0), ("markdown", 12, 0), ("clean", 0, 0), ("verbose", 12, 6)])
+def test_mock_shapes(sheet, run_cli, shape, issues, unparsed):
+    summary = run_cli(sheet(), "--backend", "mock", "--mock-shape", shape, "--mock-latency", "5")
+    assert summary["failed_batches"] == 0
+    assert summary["sent_rows"] == 60
+    assert (summary["ai_issues"], summary["unparsed_lines"]) == (issues, unparsed)
+
+
+def test_bench(tmp_path, run_cli):
+    run_cli("--bench", "--bench-sizes", "200", "--mock-latency", "5", summary=False)
+    with open(tmp_path / "LQA_Benchmark.json", encoding="utf-8") as f:
+        result = json.load(f)
+    [row] = result["results"]
+    assert row["rows"] == 200 and row["failed_batches"] == 0
+    assert row["rows_per_s"] > 0 and 0 < row["p50_ms"] <= row["p95_ms"] and row["peak_rss_mb"] > 0
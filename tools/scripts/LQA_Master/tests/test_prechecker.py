@@ -0,0 +1,23 @@
+"""预检不落盘 (findings_path=None) 与只有表头的表格。"""
+import lqa_tool
+
+
+def test_without_findings_path(tmp_path):
+    path = tmp_path / "t.csv"
+    path.write_text("ID,Source,Target\na,你好,\nb,确定,OK\n", encoding="utf-8")
+    checker = lqa_tool.PreChecker()
+    chunks = list(checker.iter_chunks(lqa_tool.iter_sheet_chunks(str(path))))
+    assert [c["_send"] for c in chunks] == [[False, True]]
+    assert checker.counts == {"Missing": 1}
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_header_only_sheet(tmp_path):
+    path = tmp_path / "t.csv"
+    path.write_text("ID,Source,Target\n", encoding="utf-8")
+    findings = tmp_path / "findings.csv"
+    checker = lqa_tool.PreChecker(findings_path=str(findings))
+    chunks = list(checker.iter_chunks(lqa_tool.annotate_source_chunks(lqa_tool.iter_sheet_chunks(str(path)))))
+    assert all(not c["_row"] for c in chunks)
+    assert checker.rows == 0
+    assert findings.read_text(encoding="utf-8-sig").splitlines() == ["Row,ID,Category,Detail"]
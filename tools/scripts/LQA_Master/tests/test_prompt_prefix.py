@@ -0,0 +1,47 @@
+"""--prefix-cache：模拟服务器记录的每个请求都带同一个 system 前缀 (说明 + 完整术语表)，用户消息只有待审行。"""
+import json
+
+
+def _records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["messages"] for line in f]
+
+
+def _write_glossary(tmp_path):
+    (tmp_path / "glossary.csv").write_text("Source,Target\n宝箱,chest\n奖励,reward\n金币,gold\n", encoding="utf-8")
+
+
+def test_prefix_is_sent_as_stable_system_message(tmp_path, sheet, run_cli):
+    _write_glossary(tmp_path)
+    summary = run_cli(sheet(), "--backend", "mock", "--mock-latency", "5", "--glossary", "glossary.csv",
+                      "--prefix-cache", "--mock-record", "sent.jsonl", "--max-rows", "10", "--min-rows", "1")
+    assert summary["failed_batches"] == 0
+    records = _records(tmp_path / "sent.jsonl")
+    assert len(records) == summary["requests"] == 6
+    systems = {m[0]["content"] for m in records}
+    assert len(systems) == 1
+    [system] = systems
+    assert "宝箱 | chest" in system and "金币 | gold" in system  # 完整术语表，包括本表没有出现的术语
+    sent_ids = []
+    for messages in records:
+        assert [m["role"] for m in messages] == ["system", "user"]
+        suffix = messages[1]["content"]
+        assert suffix.startswith("审核以下翻译")  # 后缀不再重复说明和术语
+        sent_ids += [line.split(" | ")[0] for line in suffix.splitlines() if line.startswith("ui_")]
+    assert sorted(sent_ids) == sorted(f"ui_{i}" for i in range(60))
+
+    with open(tmp_path / "t_LQA_Trace.jsonl", encoding="utf-8") as f:
+        trace = [json.loads(line) for line in f]
+    # system 消息逐字发送，不计为节省；模拟服务器对重复前缀报告 cached_tokens
+    assert all(t["prefix_saved_bytes"] == 0 for t in trace)
+    assert sum(1 for t in trace if t.get("cached_tokens")) >= len(trace) - 4
+
+
+def test_without_prefix_cache_glossary_goes_into_prompt(tmp_path, sheet, run_cli):
+    _write_glossary(tmp_path)
+    run_cli(sheet(), "--backend", "mock", "--mock-latency", "5", "--glossary", "glossary.csv",
+            "--mock-record", "sent.jsonl", "--max-rows", "10", "--min-rows", "1")
+    for messages in _records(tmp_path / "sent.jsonl"):
+        assert [m["role"] for m in messages] == ["user"]
+        # 按批注入：只有本批原文中出现的术语
+        assert "宝箱 | chest" in messages[0]["content"] and "金币 | gold" not in messages[0]["content"]
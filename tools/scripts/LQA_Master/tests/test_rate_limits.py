@@ -0,0 +1,78 @@
+"""限流调度：令牌桶、429 退避重试与 AIMD 并发调整，以及 fake 后端注入 429 时整表仍能跑完。"""
+import json
+
+import pytest
+
+import lqa_tool
+
+
+class FlakyModel:
+    """前 failures 次调用抛出 error，之后正常返回。"""
+
+    def __init__(self, failures, error=None):
+        self.failures = failures
+        self.error = error or lqa_tool.FakeRateLimitError("429 Resource has been exhausted")
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return lqa_tool.ModelResponse("ok")
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = lqa_tool.TokenBucket(600)  # 每秒补充 10 个
+    assert bucket.acquire(600) == 0.0
+    assert 0.2 <= bucket.acquire(3) < 1.0
+    assert lqa_tool.TokenBucket(0).acquire(10 ** 6) == 0.0  # 0 表示不限
+
+
+def test_rate_wait_is_reported():
+    client = lqa_tool.ModelClient(FlakyModel(0), rpm=600, tpm=0)
+    client.request_bucket.tokens = 0
+    info = {}
+    client.generate("prompt", info)
+    assert info["rate_wait_s"] >= 0.05
+    assert client.stats["rate_wait_s"] == info["rate_wait_s"]
+
+
+def test_throttle_backs_off_and_halves_concurrency(monkeypatch):
+    monkeypatch.setattr(lqa_tool, "BACKOFF_BASE_S", 0.01)
+    client = lqa_tool.ModelClient(FlakyModel(2), max_concurrency=4, rpm=0, tpm=0)
+    info = {}
+    assert client.generate("prompt", info) == "ok"
+    assert info["attempts"] == 3
+    assert (client.stats["requests"], client.stats["retries"], client.stats["throttled"]) == (3, 2, 2)
+    assert client.limiter.limit == 2  # 4 → 2 → 1，成功 1 次后回升到 2
+
+
+def test_non_retryable_error_fails_fast(monkeypatch):
+    monkeypatch.setattr(lqa_tool, "BACKOFF_BASE_S", 0.01)
+    model = FlakyModel(1, ValueError("400 invalid argument"))
+    client = lqa_tool.ModelClient(model, rpm=0, tpm=0)
+    with pytest.raises(ValueError):
+        client.generate("prompt")
+    assert model.calls == 1
+    assert client.limiter.limit == client.limiter.max_limit
+
+
+def test_retry_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(lqa_tool, "BACKOFF_BASE_S", 0.001)
+    model = FlakyModel(10)
+    client = lqa_tool.ModelClient(model, rpm=0, tpm=0, max_retries=2)
+    with pytest.raises(lqa_tool.FakeRateLimitError):
+        client.generate("prompt")
+    assert model.calls == 3
+
+
+def test_fake_429_run_completes(tmp_path, sheet, run_cli):
+    summary = run_cli(sheet(), "--backend", "fake", "--fake-429", "0.25", "--fake-latency", "0.01", "--fake-spike", "0",
+                      "--max-rows", "3", "--min-rows", "1")
+    assert summary["failed_batches"] == 0
+    assert summary["ai_issues"] == 40  # 每批前两行各一个问题
+    with open(tmp_path / "t_LQA_Trace.jsonl", encoding="utf-8") as f:
+        trace = [json.loads(line) for line in f]
+    assert len(trace) == summary["requests"] == 20
+    assert sum(t["attempts"] for t in trace) > len(trace)  # 注入的 429 被重试
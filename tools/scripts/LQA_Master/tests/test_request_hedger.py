@@ -0,0 +1,56 @@
+"""对冲请求：p95 阈值样本只取主请求耗时；fake 后端注入重尾延迟时触发对冲，且不超过预算。"""
+import json
+import threading
+import time
+
+import lqa_tool
+
+
+def test_hedge_win_records_primary_latency():
+    hedger = lqa_tool.RequestHedger(budget=1.0, percentile=95, min_samples=3)
+    hedger.recent.extend([0.05] * 3)
+    hedger.stats["calls"] = 10
+    calls = []
+    primary_done = threading.Event()
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:  # 主请求慢，对冲快
+            time.sleep(0.4)
+            primary_done.set()
+            return "primary"
+        return "hedge"
+
+    result, hedged, won = hedger.call(fn)
+    assert (result, hedged, won) == ("hedge", True, True)
+    assert len(hedger.recent) == 3  # 对冲胜出不产生样本
+    assert primary_done.wait(2)
+    deadline = time.time() + 2
+    while len(hedger.recent) < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    assert hedger.recent[-1] >= 0.4
+
+
+def _hedged_run(tmp_path, sheet, run_cli, budget):
+    summary = run_cli(sheet(300), "--backend", "fake", "--fake-tail", "1.5", "--fake-latency", "0.01", "--fake-429", "0",
+                      "--fake-spike", "0", "--rpm", "0", "--hedge", "--hedge-budget", str(budget), "--max-rows", "2", "--min-rows", "1")
+    with open(tmp_path / "t_LQA_Trace.jsonl", encoding="utf-8") as f:
+        trace = [json.loads(line) for line in f]
+    return summary, trace
+
+
+def test_heavy_tail_triggers_hedges(tmp_path, sheet, run_cli):
+    summary, trace = _hedged_run(tmp_path, sheet, run_cli, 0.2)
+    assert summary["failed_batches"] == 0 and len(trace) == 150
+    hedged = sum(bool(t.get("hedged")) for t in trace)
+    won = sum(bool(t.get("hedge_won")) for t in trace)
+    assert 0 < hedged <= 0.2 * len(trace)
+    assert won <= hedged
+    metrics = (tmp_path / "t_LQA_Metrics.prom").read_text(encoding="utf-8")
+    assert f'lqa_hedges_total{{file="t.csv",winner="hedge"}} {won}' in metrics
+
+
+def test_hedge_budget_caps_extra_requests(tmp_path, sheet, run_cli):
+    summary, trace = _hedged_run(tmp_path, sheet, run_cli, 0.01)
+    assert summary["failed_batches"] == 0
+    assert sum(bool(t.get("hedged")) for t in trace) <= 0.01 * len(trace)
@@ -0,0 +1,15 @@
+"""响应缓存不能跨后端复用：先跑假模型再跑模拟服务器，第二次必须真实请求。"""
+
+
+def test_fake_then_mock_misses_cache(sheet, run_cli):
+    name = sheet()
+    fake = run_cli(name, "--backend", "fake", "--fake-latency", "0.01", "--fake-429", "0", "--fake-spike", "0")
+    assert fake["cache_misses"] == fake["requests"] > 0
+
+    mock = run_cli(name, "--backend", "mock")
+    assert mock["cache_hits"] == 0
+    assert mock["cache_misses"] == mock["requests"] > 0
+
+    # 同一后端重跑仍然命中缓存
+    again = run_cli(name, "--backend", "mock")
+    assert again["cache_hits"] == again["requests"] > 0
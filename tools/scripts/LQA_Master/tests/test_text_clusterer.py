@@ -0,0 +1,19 @@
+"""模板 / 近似聚类不能把数字不一致的行并入簇。"""
+import pytest
+
+import lqa_tool
+
+
+@pytest.mark.parametrize("mode", ["template", "near"])
+def test_number_mismatch_is_not_clustered(mode):
+    clusterer = lqa_tool.TextClusterer(mode)
+    chunk = {
+        "_row": [1, 2, 3, 4],
+        "ID": ["a", "b", "c", "d"],
+        "Source": ["获得 5 金币", "获得 5 金币", "获得 7 金币", "获得 8 金币"],
+        "Target": ["Get 5 gold", "Get 50 gold", "Get 7 gold", "Get 80 gold"],
+    }
+    out = next(clusterer.iter_chunks([chunk]))
+    # 行 1 为代表行，行 3 数字一致并入；行 2 / 4 数字不一致，单独送审
+    assert out["_send"] == [True, True, False, True]
+    assert clusterer.members == {1: [(3, "c")]}
@@ -48,7 +48,7 @@
 
 3. 导入视频
    • 点击"📂 导入视频"选择 MP4/MOV 文件
-   • 选择处理模式: 标准 / 高密度
+   • 选择处理模式: 标准 / 高密度 / 关键帧
 
 4. 开始分析
    • 点击"🔍 开始分析"
@@ -82,15 +82,25 @@
 
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
+import customtkinter as ctk
 import google.generativeai as genai
 import os
+import sys
 import time
+import random
 import threading
 import json
 import re
 import math
+import hashlib
 import difflib
+import shutil
+import subprocess
+import tempfile
+import csv
 import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from PIL import Image
 
@@ -104,10 +114,31 @@ CONFIG_FILE = "config.json"
 HISTORY_DB_FILE = "history_db.json"
 EVOLUTION_DB_FILE = "evolution_memory.json"
 GLOSSARY_FILE = "glossary.txt"
+UPLOAD_CACHE_FILE = "upload_cache.json"
 
 TARGET_LANGUAGES = ["English", "German", "French", "Turkish", "Spanish", "Portuguese", "Russian", "Japanese", "Korean"]
 MODEL_LIST = ["gemini-3-flash-preview", "gemini-3-pro-preview", "gemini-2.5-flash"]
 
+DENSITY_SEGMENT_SECONDS = 30
+DENSITY_WORKERS = 4      # 高密模式并发请求数 (免费档 RPM 较低时可调小)
+DENSITY_RETRIES = 2      # 单次请求 (高密分段 / 关键帧批次) 失败重试次数 (指数退避 2s / 4s)
+CHUNK_MINUTES = 10       # 高密模式下长视频按 10 分钟本地切片，分别上传
+UPLOAD_WORKERS = 3       # 切片并发上传数
+UPLOAD_TTL_HOURS = 48    # Gemini 上传文件保留 48 小时
+UPLOAD_EXPIRY_MARGIN_S = 3600   # 距过期不足 1 小时的上传不再复用
+UPLOAD_CACHE_MAX_GB = 18        # 云端缓存总量上限 (Gemini 每个项目 20GB)，超出按最早上传淘汰
+UPLOAD_GONE_CODES = (403, 404)  # get_file 返回这些状态码说明云端文件已删除 / 过期，其它错误只重试不淘汰
+POLL_INITIAL_S = 0.5     # 上传后轮询处理状态：0.5s 起步，每次 ×1.5，封顶 10s
+POLL_MAX_S = 10.0
+POLL_TIMEOUT_S = 1800
+SPLIT_POLL_S = 0.5       # ffmpeg 切片时检查分段列表的间隔
+
+DEDUP_THRESHOLD = 0.85   # SequenceMatcher 相似度超过该值视为重复 (与原逐条比对一致)
+DEDUP_SHINGLE = 2        # 字符 2-gram
+DEDUP_BANDS = 32         # LSH 32 个 band × 每 band 3 个 MinHash：2-gram Jaccard 0.5 (≈ ratio 0.85 的下限) 的行有 98.6% 概率进入候选
+DEDUP_ROWS = 3
+MERSENNE_PRIME = (1 << 31) - 1
+
 # ==============================================================================
 # 🧠 核心 PROMPT
 # ==============================================================================
@@ -137,6 +168,8 @@ Your audience is native speakers who are extremely sensitive to unnatural phrasi
 - If a segment has absolutely NO localization or UI issues, output NOTHING for that timestamp. Do not log "Pass" or "OK". Only log actionable errors.
 """
 
+HEADER_ROW = "Time\tLocation\tIssue Type\tOriginal Text\tBetter {target_lang}\tDeep Analysis (CN)"
+
 STANDARD_INIT_PROMPT = """
 [Task]
 Audit the video from **00:00** as far as you can.
@@ -190,12 +223,430 @@ IMAGE_PROMPT_FOLLOWUP = """
 只输出修改后的内容或完整报告。
 """
 
+KEYFRAME_PROMPT = """
+[Input]
+The images below are keyframes captured locally at every scene / UI change of the video ({first_time} - {last_time}).
+Each image is preceded by its timestamp, e.g. "[3:25]". Use that exact timestamp in the Time column.
+
+[Instruction]
+1. Scan every visible UI element and dialogue subtitle in each frame.
+2. If text is blurry or ambiguous, SKIP it. Do not guess.
+3. The same UI may appear in several frames. Log each issue only once, at its first timestamp.
+
+[Header Rule]
+{header_instruction}
+"""
+
 REFLECTION_PROMPT = """
 Analyze the user's complaint and extract a general rule.
 Complaint: "{user_input}"
 Output ONLY the rule sentence in English.
 """
 
+# ==============================================================================
+# 🎞️ 关键帧提取 (本地解码，只发送场景/UI 变化后的画面)
+# ==============================================================================
+KEYFRAME_SAMPLE_FPS = 2            # 每秒解码采样帧数
+KEYFRAME_ANALYSIS_SIZE = (640, 360) # 差分分析用的灰度缩略图尺寸
+KEYFRAME_GRID = (64, 36)           # 差分按 64x36 个区域 (约一个字大小) 统计，单个字变化也不会被全图平均稀释
+KEYFRAME_CELL_DELTA = 12.0         # 任一区域平均灰度变化 > 12 视为 UI/字幕变化 (压缩噪声约 2)
+KEYFRAME_HIST_DISTANCE = 0.20      # 直方图 Bhattacharyya 距离超过该值视为切场景
+KEYFRAME_STABLE_DELTA = 4.0        # 与前一采样帧各区域变化都 < 4 -> 转场结束，画面稳定
+KEYFRAME_SETTLE_SECONDS = 1.0      # 转场/动画最多等待 1 秒，超时直接取帧
+KEYFRAME_MIN_GAP_SECONDS = 1.0     # 两个关键帧之间的最小间隔 (持续运动画面不会刷屏)
+KEYFRAME_HASH_DISTANCE = 6         # dHash 汉明距离 <= 6 的旧帧才做像素级复核
+KEYFRAME_MAX_SIDE = 1280           # 发送前缩放到最长边 1280，保证小字可读
+KEYFRAME_JPEG_QUALITY = 85
+KEYFRAMES_PER_REQUEST = 40         # 单次请求的图片数上限
+KEYFRAME_REQUEST_BYTES = 15 * 1024 * 1024  # 内联图片总量上限 (Gemini 单请求 20MB)
+IMAGE_TOKENS_PER_TILE = 258        # Gemini 图片按 768x768 切块计费，每块 258 tokens
+VIDEO_TOKENS_PER_SECOND = 295      # Gemini 视频 ≈ 263 (画面 1fps) + 32 (音频) tokens/s
+
+def frame_dhash(gray):
+    """64 位差值哈希：缩到 9x8，比较相邻像素明暗"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return sum(1 << i for i, b in enumerate(bits) if b)
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+def region_delta(a, b):
+    """两张灰度缩略图逐区域平均差值的最大值"""
+    return float(cv2.resize(cv2.absdiff(a, b), KEYFRAME_GRID, interpolation=cv2.INTER_AREA).max())
+
+def extract_keyframes(path, progress=None):
+    """
+    解码视频，按帧差 + 直方图距离检测场景/UI 变化，等画面稳定后取一帧。
+    dHash 找出相似的旧关键帧后再做像素级复核，只换了字幕的画面不会被误删。
+    返回 (keyframes, duration_s)，keyframe = {"t": 秒, "jpeg": bytes, "tiles": 计费块数}
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened(): raise ValueError("Cannot open video for keyframe extraction.")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+    step = max(1, int(round(fps / KEYFRAME_SAMPLE_FPS)))
+
+    keyframes = []
+    seen = []  # [(dhash, 缩略图)]，用于重复画面判定
+    last_small = last_hist = prev_small = None
+    last_emit_t = -KEYFRAME_MIN_GAP_SECONDS
+    pending_since = None
+    idx = 0
+    try:
+        while True:
+            if idx % step:
+                # 非采样帧只 grab 不 retrieve，省掉颜色转换和拷贝
+                if not cap.grab(): break
+                idx += 1
+                continue
+            ok, frame = cap.read()
+            if not ok: break
+            t = idx / fps
+            idx += 1
+
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            small = cv2.resize(gray, KEYFRAME_ANALYSIS_SIZE, interpolation=cv2.INTER_AREA)
+            hist = cv2.calcHist([small], [0], None, [64], [0, 256])
+            cv2.normalize(hist, hist)
+
+            if last_small is None:
+                changed = True
+            else:
+                changed = (region_delta(small, last_small) > KEYFRAME_CELL_DELTA or
+                           cv2.compareHist(hist, last_hist, cv2.HISTCMP_BHATTACHARYYA) > KEYFRAME_HIST_DISTANCE)
+
+            if not changed:
+                pending_since = None  # 闪一下又回到原画面，不取帧
+            else:
+                if pending_since is None: pending_since = t
+                stable = prev_small is None or region_delta(small, prev_small) < KEYFRAME_STABLE_DELTA
+                if (stable or t - pending_since >= KEYFRAME_SETTLE_SECONDS) and t - last_emit_t >= KEYFRAME_MIN_GAP_SECONDS:
+                    h = frame_dhash(gray)
+                    duplicate = any(hamming_distance(h, sh) <= KEYFRAME_HASH_DISTANCE and
+                                    region_delta(small, ss) <= KEYFRAME_CELL_DELTA for sh, ss in seen)
+                    if not duplicate:
+                        height, width = frame.shape[:2]
+                        scale = min(1.0, KEYFRAME_MAX_SIDE / max(width, height))
+                        if scale < 1.0:
+                            frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+                            height, width = frame.shape[:2]
+                        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, KEYFRAME_JPEG_QUALITY])
+                        if ok:
+                            tiles = 1 if max(width, height) <= 384 else math.ceil(width / 768) * math.ceil(height / 768)
+                            keyframes.append({"t": t, "jpeg": buf.tobytes(), "tiles": tiles})
+                            seen.append((h, small))
+                            last_emit_t = t
+                    last_small, last_hist = small, hist
+                    pending_since = None
+            prev_small = small
+
+            if progress and idx % (step * KEYFRAME_SAMPLE_FPS * 10) == 1:
+                progress(t, duration, len(keyframes))
+    finally:
+        cap.release()
+    return keyframes, duration
+
+def batch_keyframes(keyframes):
+    """按张数和字节数切分请求"""
+    batch, size = [], 0
+    for kf in keyframes:
+        if batch and (len(batch) >= KEYFRAMES_PER_REQUEST or size + len(kf["jpeg"]) > KEYFRAME_REQUEST_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append(kf)
+        size += len(kf["jpeg"])
+    if batch: yield batch
+
+# ==============================================================================
+# ♻️ 上传复用缓存
+# ==============================================================================
+
+class UploadCache:
+    """
+    upload_cache.json: 内容哈希 -> 云端文件名 / 过期时间 / 上传耗时。
+    同一视频换语言、换模型重跑时直接复用仍然有效的上传；云端文件只在过期或超出存储预算时删除。
+    长视频的切片方案 (plans) 也一并记录，切片全部命中时连本地切片都跳过。
+    """
+    def __init__(self, path=UPLOAD_CACHE_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.data = {"files": {}, "plans": {}, "hashes": {}}
+        self.hits = 0
+        self.saved_s = 0.0
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f: self.data.update(json.load(f))
+            except: pass
+        now = time.time()
+        self.data["files"] = {k: v for k, v in self.data["files"].items() if v["expires"] - UPLOAD_EXPIRY_MARGIN_S > now}
+        self.data["plans"] = {k: v for k, v in self.data["plans"].items() if all(c[2] in self.data["files"] for c in v)}
+
+    def begin_run(self):
+        self.hits = 0
+        self.saved_s = 0.0
+
+    def content_hash(self, path, memo=True):
+        """整文件 SHA-256；按 (路径, 大小, 修改时间) 记住结果，同一文件重跑不必再算"""
+        st = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        with self.lock:
+            cached = self.data["hashes"].get(memo_key)
+        if cached: return cached
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(8 * 1024 * 1024), b""): sha.update(block)
+        digest = sha.hexdigest()
+        if memo:
+            with self.lock:
+                hashes = self.data["hashes"]
+                hashes[memo_key] = digest
+                while len(hashes) > 200: hashes.pop(next(iter(hashes)))
+                self._save()
+        return digest
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.data["files"].get(key)
+            if entry and entry["expires"] - UPLOAD_EXPIRY_MARGIN_S > time.time(): return entry
+            return None
+
+    def record_hit(self, entry):
+        with self.lock:
+            self.hits += 1
+            self.saved_s += entry.get("upload_s", 0)
+
+    def put(self, key, name, expires, size, upload_s):
+        """记录新上传；超出存储预算时淘汰最早的上传，返回需要删除的云端文件名"""
+        with self.lock:
+            files = self.data["files"]
+            files[key] = {"name": name, "expires": expires, "bytes": size, "upload_s": round(upload_s, 1), "uploaded": time.time()}
+            evicted = []
+            while sum(v["bytes"] for v in files.values()) > UPLOAD_CACHE_MAX_GB * 1024 ** 3 and len(files) > 1:
+                oldest = min((k for k in files if k != key), key=lambda k: files[k]["uploaded"])
+                evicted.append(files.pop(oldest)["name"])
+            self._save()
+        return evicted
+
+    def evict(self, key):
+        with self.lock:
+            self.data["files"].pop(key, None)
+            self._save()
+
+    def get_plan(self, key):
+        with self.lock:
+            plan = self.data["plans"].get(key)
+            if plan and all(self.lookup(chunk_key) for _, _, chunk_key in plan): return plan
+            return None
+
+    def put_plan(self, key, plan):
+        with self.lock:
+            self.data["plans"][key] = plan
+            self._save()
+
+    def summary(self):
+        return f"♻️ {self.hits} upload(s) reused, ~{self.saved_s:.0f}s saved" if self.hits else ""
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(self.data, f)
+            os.replace(tmp, self.path)
+        except: pass
+
+# ==============================================================================
+# 🧹 近似重复过滤 (MinHash + LSH)
+# ==============================================================================
+
+class NearDuplicateIndex:
+    """
+    按问题类型分桶的字符 n-gram MinHash/LSH 索引。新行只和同一 LSH 桶里的候选做 SequenceMatcher 复核，
+    判定阈值与原来的逐条比对相同 (ratio > 0.85)，每行耗时不再随已有记录数线性增长。
+    """
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=DEDUP_BANDS, rows=DEDUP_ROWS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, bands * rows, dtype=np.int64)
+        self.b = rng.integers(0, MERSENNE_PRIME, bands * rows, dtype=np.int64)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.records = []
+        self.exact = set()
+        self.buckets = {}  # (类型, band 序号, band 取值) -> [记录下标]
+        self.comparisons = 0
+
+    def signature(self, text):
+        grams = {text[i:i + DEDUP_SHINGLE] for i in range(max(1, len(text) - DEDUP_SHINGLE + 1))}
+        x = np.fromiter((hash(g) & MERSENNE_PRIME for g in grams), dtype=np.int64, count=len(grams))
+        return ((np.outer(x, self.a) + self.b) % MERSENNE_PRIME).min(axis=0)
+
+    def add_if_new(self, issue_type, text):
+        """已有相似记录返回 True；否则登记并返回 False"""
+        if (issue_type, text) in self.exact: return True
+        sig = self.signature(text)
+        keys = [(issue_type, i, sig[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+        checked = set()
+        for key in keys:
+            for idx in self.buckets.get(key, ()):
+                if idx in checked: continue
+                checked.add(idx)
+                self.comparisons += 1
+                seq = difflib.SequenceMatcher(None, text, self.records[idx])
+                # real_quick_ratio / quick_ratio 是 ratio 的上界，先用它们快速排除
+                if seq.real_quick_ratio() > self.threshold and seq.quick_ratio() > self.threshold and seq.ratio() > self.threshold:
+                    return True
+        idx = len(self.records)
+        self.records.append(text)
+        self.exact.add((issue_type, text))
+        for key in keys: self.buckets.setdefault(key, []).append(idx)
+        return False
+
+def bench_dedup(n=10000, seed=7):
+    """python ui_localizer.py --bench-dedup [N]：合成 N 行审计结果，对比逐条 difflib 与索引版的耗时和判定一致性"""
+    rng = random.Random(seed)
+    letters = "eeeeeeeeeeeetttttttttaaaaaaaaoooooooiiiiiiinnnnnnnsssssshhhhhhrrrrrrddddllllcccuuummwwffggyyppbbvkjxqz"
+    words = ["".join(rng.choice(letters) for _ in range(rng.randint(2, 9))) for _ in range(3000)]  # 按英文字母频率造词
+    types = ["truncation", "untranslated", "grammar/spelling", "style/tone", "consistency"]
+
+    def mutate(text):
+        chars = list(text)
+        for _ in range(rng.randint(1, 3)):
+            i = rng.randrange(len(chars))
+            op = rng.random()
+            if op < 0.4: chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+            elif op < 0.7: del chars[i]
+            else: chars.insert(i, rng.choice("abcdefghijklmnopqrstuvwxyz !."))
+        return "".join(chars) or text
+
+    rows = []
+    for _ in range(n):
+        if rows and rng.random() < 0.3:
+            issue_type, text = rng.choice(rows)
+            rows.append((issue_type, mutate(text)))
+        else:
+            rows.append((rng.choice(types), " ".join(rng.choice(words) for _ in range(rng.randint(2, 8)))))
+
+    print(f"Running the O(n²) difflib baseline on {n} rows, this is quadratic and may take ~10 minutes at 10k rows...")
+    t0 = time.perf_counter()
+    legacy, records = [], []
+    for issue_type, text in rows:
+        dup = any(r[0] == issue_type and difflib.SequenceMatcher(None, text, r[1]).ratio() > DEDUP_THRESHOLD for r in records)
+        if not dup: records.append((issue_type, text))
+        legacy.append(dup)
+    legacy_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index = NearDuplicateIndex()
+    indexed = [index.add_if_new(issue_type, text) for issue_type, text in rows]
+    indexed_s = time.perf_counter() - t0
+
+    agree = sum(x == y for x, y in zip(legacy, indexed))
+    missed = sum(x and not y for x, y in zip(legacy, indexed))
+    print(f"rows: {n}  duplicates (difflib): {sum(legacy)}  duplicates (index): {sum(indexed)}")
+    print(f"difflib scan : {legacy_s:.2f}s ({legacy_s / n * 1000:.2f} ms/row)")
+    print(f"MinHash/LSH  : {indexed_s:.2f}s ({indexed_s / n * 1000:.2f} ms/row, {index.comparisons / n:.1f} candidates/row)")
+    print(f"speedup: {legacy_s / max(indexed_s, 1e-9):.1f}x  agreement: {agree / n:.2%}  missed duplicates: {missed}")
+
+# ==============================================================================
+# ✂️ 长视频本地切片
+# ==============================================================================
+
+def read_segment_list(list_path):
+    """读取 ffmpeg -segment_list 的 csv：[(全局起点秒, 片段时长秒, 文件名)]，忽略尚未写完的最后一行"""
+    try:
+        with open(list_path, newline="", encoding="utf-8") as f: text = f.read()
+    except FileNotFoundError:
+        return []
+    lines = text.split("\n")[:-1]  # 最后一个换行之后的内容可能是正在写的半行
+    return [(float(row[1]), float(row[2]) - float(row[1]), row[0]) for row in csv.reader(lines) if len(row) >= 3]
+
+
+def iter_ffmpeg_segments(cmd, list_path, chunk_pattern):
+    """
+    后台运行 ffmpeg segment，片段一写完就产出，上传可与切片重叠。
+    列表里出现某段且下一段文件已开始写 (上一段已关闭)，或 ffmpeg 已退出，才视为写完。
+    """
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=err)
+        emitted = 0
+        try:
+            while True:
+                finished = proc.poll() is not None
+                rows = read_segment_list(list_path)
+                if finished and proc.returncode != 0:
+                    err.seek(0)
+                    raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=err.read())
+                while emitted < len(rows) and (finished or os.path.exists(chunk_pattern % (emitted + 1))):
+                    start, length, name = rows[emitted]
+                    emitted += 1
+                    yield start, length, os.path.join(os.path.dirname(list_path), name)
+                if finished: return
+                time.sleep(SPLIT_POLL_S)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+
+def split_video(path, chunk_seconds, out_dir, max_seconds=None):
+    """
+    把视频切成 chunk_seconds 长的片段，逐个产出 (全局起点秒, 片段时长秒, 片段路径)，每切完一段立即产出。
+    优先 ffmpeg 流拷贝 (不重编码，秒级完成，按关键帧切，起点以 ffmpeg 实际切点为准)；
+    没有 ffmpeg 时用 OpenCV 重编码 (无音轨，字幕画面不受影响)。ffmpeg 中途失败时从已产出部分的终点改用 OpenCV 续切。
+    """
+    resume_s = 0.0
+    if shutil.which("ffmpeg"):
+        ext = os.path.splitext(path)[1] or ".mp4"
+        list_path = os.path.join(out_dir, "chunks.csv")
+        chunk_pattern = os.path.join(out_dir, "chunk_%03d" + ext)
+        cmd = ["ffmpeg", "-v", "error", "-y", "-i", path]
+        if max_seconds: cmd += ["-t", str(max_seconds)]
+        cmd += ["-map", "0:v:0", "-map", "0:a?", "-c", "copy", "-f", "segment", "-segment_time", str(chunk_seconds),
+                "-reset_timestamps", "1", "-segment_list", list_path, "-segment_list_type", "csv", chunk_pattern]
+        emitted = set()
+        try:
+            for start, length, chunk_path in iter_ffmpeg_segments(cmd, list_path, chunk_pattern):
+                emitted.add(chunk_path)
+                resume_s = start + length
+                yield start, length, chunk_path
+            return
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            print(f"ffmpeg split failed, falling back to OpenCV from {resume_s:.0f}s: {e}")
+            for name in os.listdir(out_dir):
+                if os.path.join(out_dir, name) not in emitted: os.remove(os.path.join(out_dir, name))
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened(): raise ValueError("Cannot open video for splitting.")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    frames_per_chunk = max(1, int(round(chunk_seconds * fps)))
+    limit = int(max_seconds * fps) if max_seconds else None
+    first = int(round(resume_s * fps))
+    if first: cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    prefix = "chunk_cv_" if first else "chunk_"  # 续切时避开 ffmpeg 已产出 (可能仍在上传) 的文件名
+    writer = None
+    idx = start_idx = first
+    try:
+        while limit is None or idx < limit:
+            ok, frame = cap.read()
+            if not ok: break
+            if (idx - first) % frames_per_chunk == 0:
+                if writer:
+                    writer.release()
+                    yield start_idx / fps, (idx - start_idx) / fps, chunk_path
+                chunk_path = os.path.join(out_dir, f"{prefix}{(idx - first) // frames_per_chunk:03d}.mp4")
+                writer = cv2.VideoWriter(chunk_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+                start_idx = idx
+            writer.write(frame)
+            idx += 1
+        if writer:
+            writer.release()
+            writer = None
+            yield start_idx / fps, (idx - start_idx) / fps, chunk_path
+    finally:
+        if writer: writer.release()
+        cap.release()
+
 # ==============================================================================
 # 🏗️ 主程序类
 # ==============================================================================
@@ -217,8 +668,10 @@ class VideoLocalizationApp(ctk.CTk):
         self.history_data = []
         self.evolution_memory = [] 
         
-        # 运行时去重记录
-        self.dedup_records = []
+        # 运行时去重索引
+        self.dedup_index = NearDuplicateIndex()
+
+        self.upload_cache = UploadCache()
 
         self._ensure_glossary_exists()
         self._init_ui()
@@ -310,6 +763,7 @@ class VideoLocalizationApp(ctk.CTk):
         self.mode_var = tk.StringVar(value="standard")
         ctk.CTkRadioButton(ctrl_frame, text="标准(长视频)", variable=self.mode_var, value="standard").pack(side="left", padx=5)
         ctk.CTkRadioButton(ctrl_frame, text="高密(30s切片)", variable=self.mode_var, value="density").pack(side="left", padx=5)
+        ctk.CTkRadioButton(ctrl_frame, text="关键帧(省流)", variable=self.mode_var, value="keyframe").pack(side="left", padx=5)
 
         # 智能去重开关
         self.var_dedup = ctk.BooleanVar(value=True)
@@ -396,6 +850,25 @@ class VideoLocalizationApp(ctk.CTk):
         last_m, last_s = matches[-1]
         return int(last_m) * 60 + int(last_s)
 
+    def parse_row_timestamp(self, line, default=0):
+        """取 TSV 行首列的时间 (m:ss 或 h:mm:ss)，解析不到时返回 default"""
+        match = re.match(r"\s*\[?(\d+):(\d{1,2})(?::(\d{1,2}))?", line.split("\t")[0])
+        if not match: return default
+        a, b, c = match.groups()
+        return int(a) * 3600 + int(b) * 60 + int(c) if c else int(a) * 60 + int(b)
+
+    def rebase_row(self, line, offset):
+        """切片内的局部时间戳 + 切片起点 = 全局时间戳"""
+        if not offset: return line
+        t = self.parse_row_timestamp(line, None)
+        if t is None: return line
+        parts = line.split("\t")
+        parts[0] = self.seconds_to_hms(int(t + offset))
+        return "\t".join(parts)
+
+    def is_header_row(self, line):
+        return line.split("\t")[0].strip().lower() == "time"
+
     def get_video_duration_minutes(self, path):
         try:
             cap = cv2.VideoCapture(path)
@@ -416,19 +889,14 @@ class VideoLocalizationApp(ctk.CTk):
         parts = line.split("\t")
         if len(parts) < 4: return False
         
-        if "Original" in parts[3] or "Better" in parts[4]: return False
+        if "Original" in parts[3] or (len(parts) > 4 and "Better" in parts[4]): return False
         
         current_original = parts[3].strip().lower()
         current_type = parts[2].strip().lower()
         
-        for record in self.dedup_records:
-            if record['type'] != current_type: continue
-            seq = difflib.SequenceMatcher(None, current_original, record['original'])
-            if seq.ratio() > 0.85: 
-                print(f"Skipping Duplicate: {parts[3][:20]}...")
-                return True
-                
-        self.dedup_records.append({'type': current_type, 'original': current_original})
+        if self.dedup_index.add_if_new(current_type, current_original):
+            print(f"Skipping Duplicate: {parts[3][:20]}...")
+            return True
         return False
 
     def insert_filtered_text(self, text_chunk):
@@ -478,51 +946,32 @@ class VideoLocalizationApp(ctk.CTk):
         self.progressbar.start()
         self.txt_video_out.delete("0.0", "end")
         
-        self.dedup_records = []
+        self.dedup_index = NearDuplicateIndex()
+        self.upload_cache.begin_run()
         
         mode = self.mode_var.get()
         try: total_minutes = int(self.entry_duration.get())
         except: total_minutes = 5
         
         full_report_text = ""
+        summary = ""
         
         try:
             genai.configure(api_key=key)
-            self.update_status(f"Uploading Video...")
-            
-            video_file = genai.upload_file(path=self.file_path)
-            while video_file.state.name == "PROCESSING":
-                time.sleep(2)
-                video_file = genai.get_file(video_file.name)
-            if video_file.state.name == "FAILED": raise ValueError("Video upload failed.")
-
-            self.update_status(f"Analyzing in {mode.upper()} mode...")
             model = genai.GenerativeModel(self.model_combo.get())
-            
             sys_prompt = self.get_dynamic_prompt(SYSTEM_PROMPT)
-            history = [{"role": "user", "parts": [sys_prompt, video_file]}]
-            chat = model.start_chat(history=history)
-            
-            if mode == "density":
-                if total_minutes > 10: 
-                    self.txt_video_out.insert("0.0", "⚠️ Info: High-density mode is best for clips < 10 mins.\n")
-                    total_minutes = 10
-                
-                steps = total_minutes * 2
-                for i in range(steps):
-                    start_str = self.seconds_to_hms(i * 30)
-                    end_str = self.seconds_to_hms((i + 1) * 30)
-                    
-                    header_instr = "Include the Header Row." if i == 0 else "DO NOT output the Header Row."
-                    step_prompt = DENSITY_SEGMENT_PROMPT.format(start_time=start_str, end_time=end_str, header_instruction=header_instr)
-                    
-                    self.update_status(f"Scanning: {start_str} - {end_str}...")
-                    response = chat.send_message(step_prompt)
-                    
-                    added_text = self.insert_filtered_text(response.text.strip())
-                    full_report_text += added_text
-                    time.sleep(2)
+
+            if mode == "keyframe":
+                full_report_text, summary = self.run_keyframe_audit(model, sys_prompt)
+            elif mode == "density":
+                full_report_text, summary = self.run_chunked_density(model, sys_prompt, total_minutes)
             else:
+                self.update_status(f"Uploading Video...")
+                video_file = self.upload_and_wait(self.file_path)
+                self.update_status(f"Analyzing in {mode.upper()} mode...")
+
+                history = [{"role": "user", "parts": [sys_prompt, video_file]}]
+                chat = model.start_chat(history=history)
                 self.update_status("Auditing (Initial Pass)...")
                 response = chat.send_message(STANDARD_INIT_PROMPT)
                 
@@ -549,10 +998,8 @@ class VideoLocalizationApp(ctk.CTk):
                     time.sleep(2)
 
             self.add_new_history(full_report_text, f"[VID-{mode}] {os.path.basename(self.file_path)}")
-            self.update_status("✅ DONE - Ready for Excel Copy")
-            
-            try: genai.delete_file(video_file.name)
-            except: pass
+            notes = [text for text in (summary, self.upload_cache.summary()) if text]
+            self.update_status("✅ DONE - Ready for Excel Copy" + "".join(f" | {text}" for text in notes))
             
         except Exception as e:
             self.update_status(f"Error: {str(e)}", True)
@@ -560,6 +1007,193 @@ class VideoLocalizationApp(ctk.CTk):
             self.progressbar.stop()
             self.btn_run_video.configure(state="normal")
 
+    def upload_and_wait(self, path, key=None):
+        """优先复用缓存中仍有效的上传；否则上传并登记到缓存。path 为 None 时只能走缓存 (已缓存的切片)"""
+        key = key or self.upload_cache.content_hash(path)
+        entry = self.upload_cache.lookup(key)
+        if entry:
+            video_file = self.get_cached_upload(entry)
+            if video_file and video_file.state.name == "ACTIVE":
+                self.upload_cache.record_hit(entry)
+                return video_file
+            self.upload_cache.evict(key)
+            if video_file:  # 处理失败的文件不会再变为可用，顺手删掉
+                try: genai.delete_file(entry["name"])
+                except: pass
+        if not path: raise ValueError("Cached chunk upload is gone, please run again.")
+
+        t0 = time.time()
+        video_file = self.wait_until_active(genai.upload_file(path=path))
+        expires = getattr(video_file, "expiration_time", None)
+        expires = expires.timestamp() if hasattr(expires, "timestamp") else time.time() + UPLOAD_TTL_HOURS * 3600
+        for name in self.upload_cache.put(key, video_file.name, expires, os.path.getsize(path), time.time() - t0):
+            try: genai.delete_file(name)
+            except: pass
+        return video_file
+
+    def get_cached_upload(self, entry):
+        """查询缓存的云端文件；确定已删除 / 过期 (403/404) 时返回 None。
+        网络抖动、限流等其它错误按 DENSITY_RETRIES 退避重试，仍失败则抛出，缓存条目保留给下次运行"""
+        for attempt in range(DENSITY_RETRIES + 1):
+            try:
+                return genai.get_file(entry["name"])
+            except Exception as e:
+                if getattr(e, "code", None) in UPLOAD_GONE_CODES:
+                    print(f"Cached upload gone: {e}")
+                    return None
+                if attempt == DENSITY_RETRIES: raise
+                print(f"Cached upload check failed, retrying: {e}")
+                time.sleep(2 ** (attempt + 1))
+
+    def wait_until_active(self, video_file):
+        """指数退避轮询处理状态：小文件很快就绪不用干等，大文件也不会频繁打接口"""
+        delay, t0 = POLL_INITIAL_S, time.time()
+        while video_file.state.name == "PROCESSING":
+            if time.time() - t0 > POLL_TIMEOUT_S: raise TimeoutError(f"Video processing timed out: {video_file.name}")
+            time.sleep(delay)
+            delay = min(delay * 1.5, POLL_MAX_S)
+            video_file = genai.get_file(video_file.name)
+        if video_file.state.name == "FAILED": raise ValueError(f"Video processing failed: {video_file.name}")
+        return video_file
+
+    def run_chunked_density(self, model, sys_prompt, total_minutes):
+        """
+        高密模式流水线：长视频本地切片 -> 切片并发上传 -> 每个切片上传完成即开始分段审计。
+        短于一个切片的视频直接上传原文件。返回 (报告文本, 统计)
+        """
+        total_seconds = total_minutes * 60
+        chunk_seconds = CHUNK_MINUTES * 60
+        tmp_dir = None
+        uploads = []
+        try:
+            self.update_status("Hashing video...")
+            src_key = self.upload_cache.content_hash(self.file_path)
+            if total_seconds > chunk_seconds:
+                plan_key = f"{src_key}:{chunk_seconds}:{total_seconds}"
+                plan = self.upload_cache.get_plan(plan_key)
+                if plan:
+                    self.update_status(f"Reusing {len(plan)} cached chunk uploads...")
+                    chunks = [(offset, length, None, chunk_key) for offset, length, chunk_key in plan]
+                else:
+                    tmp_dir = tempfile.mkdtemp(prefix="lqa_chunks_")
+                    self.update_status(f"Splitting video into {CHUNK_MINUTES}-min chunks...")
+                    chunks = self.iter_hashed_chunks(split_video(self.file_path, chunk_seconds, tmp_dir, max_seconds=total_seconds), plan_key)
+            else:
+                self.update_status(f"Uploading Video...")
+                chunks = [(0, total_seconds, self.file_path, src_key)]
+
+            with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as upload_pool:
+                segments = self.iter_chunk_segments(chunks, upload_pool, uploads)
+                report, summary = self.run_density_audit(model, sys_prompt, segments)
+            return report, f"{summary} | {len(uploads)} chunk(s)"
+        finally:
+            if tmp_dir: shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def iter_hashed_chunks(self, chunks, plan_key):
+        """给新切出的片段算内容哈希；全部切完后记录切片方案，下次同一视频可直接复用"""
+        plan = []
+        for offset, length, chunk_path in chunks:
+            chunk_key = self.upload_cache.content_hash(chunk_path, memo=False)
+            plan.append((offset, length, chunk_key))
+            yield offset, length, chunk_path, chunk_key
+        self.upload_cache.put_plan(plan_key, plan)
+
+    def iter_chunk_segments(self, chunks, upload_pool, uploads):
+        """切片一产出就提交上传，并展开为 (局部起点, 局部终点, 上传 Future, 全局偏移) 的分段"""
+        for offset, length, chunk_path, chunk_key in chunks:
+            fut = upload_pool.submit(self.upload_and_wait, chunk_path, chunk_key)
+            uploads.append(fut)
+            for start in range(0, int(math.ceil(length)), DENSITY_SEGMENT_SECONDS):
+                yield (start, min(start + DENSITY_SEGMENT_SECONDS, int(math.ceil(length))), fut, offset)
+
+    def run_density_audit(self, model, sys_prompt, segments):
+        """
+        segments: 可迭代的 (start_s, end_s, video_file 或上传 Future, offset_s)。
+        每段是独立的无状态请求，线程池并发执行；按提交顺序接力写入，结果天然按时间排序，表头只输出一次。
+        返回 (报告文本, 统计)
+        """
+        futures, failed = [], []
+        next_idx = 0
+        report = self.insert_filtered_text(HEADER_ROW.format(target_lang=self.lang_combo.get()))
+        t0 = time.time()
+
+        def flush(block):
+            nonlocal next_idx, report
+            while next_idx < len(futures) and (block or futures[next_idx][0].done()):
+                fut, (start, end, _, offset) = futures[next_idx]
+                try: report += self.insert_filtered_text(fut.result())
+                except Exception as e:
+                    print(f"Segment Error ({next_idx}): {e}")
+                    failed.append(f"{self.seconds_to_hms(offset + start)}-{self.seconds_to_hms(offset + end)}")
+                next_idx += 1
+                self.update_status(f"Scanning segments: {next_idx}/{len(futures)} done ({DENSITY_WORKERS} parallel, {time.time() - t0:.0f}s)...")
+
+        with ThreadPoolExecutor(max_workers=DENSITY_WORKERS) as pool:
+            for seg in segments:
+                futures.append((pool.submit(self.audit_segment, model, sys_prompt, seg), seg))
+                flush(False)
+            flush(True)
+
+        summary = f"{len(futures)} segments in {time.time() - t0:.0f}s"
+        if failed: summary += f" | ⚠️ {len(failed)} failed: {', '.join(failed[:5])}" + (" ..." if len(failed) > 5 else "")
+        return report, summary
+
+    @staticmethod
+    def generate_with_retry(model, parts):
+        """单次请求失败 (限流、5xx、网络抖动) 按 DENSITY_RETRIES 指数退避 (2s / 4s) 重试，仍失败才抛出"""
+        for attempt in range(DENSITY_RETRIES + 1):
+            try:
+                return model.generate_content(parts)
+            except Exception:
+                if attempt == DENSITY_RETRIES: raise
+                time.sleep(2 ** (attempt + 1))
+
+    def audit_segment(self, model, sys_prompt, segment):
+        """单段审计 (工作线程内执行，不碰 UI)；时间戳换算为全局时间，返回按时间排序的行"""
+        start, end, video_file, offset = segment
+        if hasattr(video_file, "result"): video_file = video_file.result()  # 等待该切片上传完成
+        prompt = DENSITY_SEGMENT_PROMPT.format(start_time=self.seconds_to_hms(start), end_time=self.seconds_to_hms(end),
+                                               header_instruction="DO NOT output the Header Row.")
+        response = self.generate_with_retry(model, [sys_prompt, video_file, prompt])
+        rows = [self.rebase_row(line.strip(), offset) for line in response.text.split("\n")
+                if line.strip() and not self.is_header_row(line)]
+        rows.sort(key=lambda line: self.parse_row_timestamp(line, offset + start))
+        return "\n".join(rows)
+
+    def run_keyframe_audit(self, model, sys_prompt):
+        """本地抽关键帧，按批以内联图片发送；返回 (报告文本, 节省统计)"""
+        def on_progress(t, duration, kept):
+            self.update_status(f"Extracting keyframes: {self.seconds_to_hms(int(t))} / {self.seconds_to_hms(int(duration))} ({kept} kept)...")
+
+        self.update_status("Extracting keyframes...")
+        keyframes, duration = extract_keyframes(self.file_path, progress=on_progress)
+        if not keyframes: raise ValueError("No keyframes extracted.")
+
+        sent_bytes = sum(len(kf["jpeg"]) for kf in keyframes)
+        video_bytes = os.path.getsize(self.file_path)
+        sent_tokens = sum(kf["tiles"] for kf in keyframes) * IMAGE_TOKENS_PER_TILE
+        video_tokens = int(duration * VIDEO_TOKENS_PER_SECOND)
+        summary = (f"{len(keyframes)} keyframes, {sent_bytes / 1048576:.1f} MB vs video {video_bytes / 1048576:.1f} MB "
+                   f"(-{max(0, 1 - sent_bytes / max(video_bytes, 1)):.0%}), "
+                   f"~{sent_tokens / 1000:.0f}k vs ~{video_tokens / 1000:.0f}k input tokens")
+        print(f"Keyframes: {summary}")
+
+        report = ""
+        batches = list(batch_keyframes(keyframes))
+        for i, batch in enumerate(batches):
+            first_str = self.seconds_to_hms(int(batch[0]["t"]))
+            last_str = self.seconds_to_hms(int(batch[-1]["t"]))
+            header_instr = "Include the Header Row." if i == 0 else "DO NOT output the Header Row."
+            parts = [sys_prompt, KEYFRAME_PROMPT.format(first_time=first_str, last_time=last_str, header_instruction=header_instr)]
+            for kf in batch:
+                parts.append(f"[{self.seconds_to_hms(int(kf['t']))}]")
+                parts.append({"mime_type": "image/jpeg", "data": kf["jpeg"]})
+
+            self.update_status(f"Analyzing keyframes {first_str} - {last_str} ({i + 1}/{len(batches)}) | {summary}")
+            response = self.generate_with_retry(model, parts)  # 单批失败不丢弃前面已分析的批次
+            report += self.insert_filtered_text(response.text.strip())
+        return report, summary
+
     # ==============================================================================
     # 🖼️ 图片业务逻辑
     # ==============================================================================
@@ -771,5 +1405,9 @@ class VideoLocalizationApp(ctk.CTk):
             self.txt_video_out.delete("0.0", "end")
 
 if __name__ == "__main__":
+    if "--bench-dedup" in sys.argv:
+        i = sys.argv.index("--bench-dedup")
+        bench_dedup(int(sys.argv[i + 1]) if len(sys.argv) > i + 1 else 10000)
+        sys.exit(0)
     app = VideoLocalizationApp()
     app.mainloop()
\ No newline at end of file